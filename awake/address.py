@@ -71,7 +71,7 @@ def fromConventional(conventional):
 
 @total_ordering
 class Address(object):
-
+    __slots__ = ('address',)
 
     def __init__(self, address):
         assert isinstance(address, int)
@@ -14,15 +14,68 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from itertools import count
 from awake.operand import ComplexValue
 from awake.operator import HighByte, LowByte, Word, LogicalNot
 
+_versions = count(1)
+
 class Context:
+    """
+    Known register values during dataflow propagation.
+
+    Each value is indexed by the registers it depends on (users), so overwriting a register
+    only touches the values that read it. Clones share their tables with the original until
+    one of them writes. Optimised values are cached per register.
+
+    The version changes on every write and is equal only for contexts with the same
+    contents (0 is the empty context), so expression nodes can cache their optimised
+    form per version.
+    """
+
     def __init__(self, values=None):
-        if not values:
-            self.values = dict()
-        else:
-            self.values = dict(values)
+        self.values = dict()
+        self.deps = dict()
+        self.users = dict()
+        self.optimized = dict()
+        self.shared = False
+        self.version = 0
+        if values:
+            for register, value in values.items():
+                self._store(register, value)
+
+    def _own(self):
+        # called before every write
+        # copy on write, the users sets themselves are never modified in place
+        self.version = next(_versions)
+        if self.shared:
+            self.values = dict(self.values)
+            self.deps = dict(self.deps)
+            self.users = dict(self.users)
+            self.optimized = dict(self.optimized)
+            self.shared = False
+
+    def _store(self, register, value, deps=None):
+        self._own()
+        if register in self.values:
+            self._remove(register)
+        if deps is None:
+            deps = value.getDependencies()
+        self.values[register] = value
+        self.deps[register] = deps
+        for d in deps:
+            self.users[d] = self.users.get(d, frozenset()) | frozenset([register])
+
+    def _remove(self, register):
+        self._own()
+        del self.values[register]
+        self.optimized.pop(register, None)
+        for d in self.deps.pop(register):
+            rest = self.users[d] - frozenset([register])
+            if rest:
+                self.users[d] = rest
+            else:
+                del self.users[d]
 
     def setValueComplex(self, register):
         if register in ('BC', 'DE', 'HL'):
@@ -30,7 +83,7 @@ class Context:
             self.setValueComplex(register[1])
         else:
             self.invalidate(register)
-            self.values[register] = ComplexValue('ctx')
+            self._store(register, ComplexValue('ctx'))
 
     def setValue(self, register, value):
         assert not isinstance(value, int)  # detect common errors
@@ -47,20 +100,17 @@ class Context:
         else:
             self.invalidate(register)
 
-            if register in value.getDependencies():
+            deps = value.getDependencies()
+            if register in deps:
                 self.setValueComplex(register)
             else:
-                self.values[register] = value
+                self._store(register, value, deps)
 
     def invalidate(self, register):
-        delete = set()
-
-        for x in self.values:
-            if self.values[x] and register in self.values[x].getDependencies():
-                delete.add(x)
-
-        for x in delete:
-            del(self.values[x])
+        """Forget the values that depend on register."""
+        if register in self.users:
+            for x in self.users[register]:
+                self._remove(x)
 
     def hasValue(self, register):
         if register in ('BC', 'DE', 'HL'):
@@ -88,16 +138,32 @@ class Context:
         if register == 'FNC':
             return LogicalNot(self.getValue('FC')).optimizedWithContext(Context())
         else:
-            return self.values[register].optimizedWithContext(Context())
+            value = self.values[register]
+            if register not in self.optimized:
+                # shared tables hold the same values, so the cached result is valid for every sharer
+                self.optimized[register] = value.optimizedWithContext(Context())
+            return self.optimized[register]
 
     def invalidateAll(self):
         self.values = dict()
+        self.deps = dict()
+        self.users = dict()
+        self.optimized = dict()
+        self.shared = False
+        self.version = 0
 
     def invalidateComplex(self):
         values = set(self.values)
         for v in values:
             if not self.hasConstantValue(v):
-                del self.values[v]
+                self._remove(v)
 
     def clone(self):
-        return Context(self.values)
+        other = Context()
+        other.values = self.values
+        other.deps = self.deps
+        other.users = self.users
+        other.optimized = self.optimized
+        other.shared = self.shared = True
+        other.version = self.version
+        return other
@@ -14,37 +14,58 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
 import sqlite3
+import time
+from bisect import bisect_left, bisect_right
 from contextlib import closing
+from itertools import chain
 from awake import address
 from awake.depend import decodeDependencySet, encodeDependencySet, unknownDependencySet
 from awake.operand import ProcAddress
+from awake.ownership import OwnershipMap
 from awake.textrenderer import HtmlRenderer
 
 def convert_address(text):
-    return address.fromConventional(text)
+    if b':' in text:
+        return address.fromConventional(text)
+    return address.Address(int(text))
 
 def adapt_address(addr):
-    return str(addr)
+    return addr.address
 
 sqlite3.register_converter('address', convert_address)
 sqlite3.register_adapter(address.Address, adapt_address)
 
-def getFirst(x, alt=None):
-    if x:
-        return x[0]
-    else:
-        return alt
+# pseudo-caller of the initial entry points, shown as FFFF:0000
+INITIAL_CALLER = address.fromVirtualAndBank(0, 0xFFFF)
+
+def bankRange(bank):
+    """Half-open range of integer addresses in ROM bank `bank`, for range scans over address columns."""
+    if bank == 0:
+        return 0, address.BANK_SIZE
+    return (address.fromVirtualAndBank(address.BANK_SIZE, bank).address,
+            address.fromVirtualAndBank(2 * address.BANK_SIZE, bank).address)
+
+PROC_COLUMNS = 'type, depset, has_switch, suspicious_switch, has_suspicious_instr, has_nop, has_ambig_calls, length'
 
 class ProcInfo(object):
     def __init__(self, connection, addr, result=None):
-
-        c = connection.cursor()
-        c.execute('select type, depset, has_switch, suspicious_switch, has_suspicious_instr, has_nop, has_ambig_calls, length from procs where addr=?', (addr,))
-        assert c.rowcount <= 1
-        result = c.fetchone()
+        """Load the info for addr. With no connection, build it from a procs row and leave the relations empty."""
 
         self.addr = addr
+        self.calls = set()
+        self.tail_calls = set()
+        self.memreads = set()
+        self.memwrites = set()
+        self.callers = set()
+
+        if connection is not None:
+            c = connection.cursor()
+            c.execute('select ' + PROC_COLUMNS + ' from procs where addr=?', (addr,))
+            assert c.rowcount <= 1
+            result = c.fetchone()
+
         if result:
             self.type = result[0]
             self.depset = decodeDependencySet(result[1])
@@ -64,56 +85,82 @@ class ProcInfo(object):
             self.has_ambig_calls = True
             self.length = 0
 
-        self.calls = set()
-        self.tail_calls = set()
+        if connection is None:
+            return
+
         c.execute('select destination, type from calls where source=?', (addr,))
         for dest, calltype in c.fetchall():
-            if calltype == 'tail':
-                self.tail_calls.add(dest)
-            else:
-                self.calls.add(dest)
+            self.addCall(dest, calltype)
 
-        self.memreads = set()
-        self.memwrites = set()
         c.execute('select addr, type from memref where proc=?', (addr,))
-        for address, reftype in c.fetchall():
-            if reftype == 'read':
-                self.memreads.add(address)
-            else:
-                self.memwrites.add(address)
+        for ref, reftype in c.fetchall():
+            self.addMemref(ref, reftype)
 
-        self.callers = set()
-        c.execute('select source from calls where destination=?', (addr,))
-        for src, in c.fetchall():
-            self.callers.add(src)
+        self.callers = loadCallers(c, addr)
 
         c.close()
 
-    def save(self, connection):
-        c = connection.cursor()
-        c.execute('select addr from procs where addr=?', (self.addr,))
-        if not c.fetchone():
-            c.execute('insert into procs(addr) values (?)', (self.addr,))
-        c.execute('update procs set type=?, depset=?, has_switch=?, suspicious_switch=?, has_suspicious_instr=? , has_nop=?, has_ambig_calls=?, length=? where addr=?',
-                  (self.type, encodeDependencySet(self.depset), int(self.has_switch), int(self.suspicious_switch), int(self.has_suspicious_instr), int(self.has_nop), int(self.has_ambig_calls), self.length, self.addr))
-
-        c.execute('delete from calls where source=?', (self.addr,))
-        c.execute('delete from memref where proc=?', (self.addr,))
+    def addCall(self, dest, calltype):
+        if calltype == 'tail':
+            self.tail_calls.add(dest)
+        else:
+            self.calls.add(dest)
 
+    def addMemref(self, ref, reftype):
+        if reftype == 'read':
+            self.memreads.add(ref)
+        else:
+            self.memwrites.add(ref)
+
+    def copy(self):
+        """Copy with its own relation sets. Dependency sets are never changed in place and stay shared."""
+        other = copy.copy(self)
+        other.calls = set(self.calls)
+        other.tail_calls = set(self.tail_calls)
+        other.memreads = set(self.memreads)
+        other.memwrites = set(self.memwrites)
+        other.callers = set(self.callers)
+        return other
+
+    def procRow(self):
+        return (self.addr, self.type, encodeDependencySet(self.depset), int(self.has_switch), int(self.suspicious_switch), int(self.has_suspicious_instr), int(self.has_nop), int(self.has_ambig_calls), self.length)
+
+    def callRows(self):
         for x in self.calls:
-            c.execute('insert into calls(source, destination, type) values (?, ?, "call")', (self.addr, x))
+            yield (self.addr, x, 'call')
         for x in self.tail_calls:
-            c.execute('insert into calls(source, destination, type) values (?, ?, "tail")', (self.addr, x))
+            yield (self.addr, x, 'tail')
+
+    def memrefRows(self):
         for x in self.memreads:
-            c.execute('insert into memref(addr, proc, type) values (?, ?, "read")', (x, self.addr))
+            yield (x, self.addr, 'read')
         for x in self.memwrites:
-            c.execute('insert into memref(addr, proc, type) values (?, ?, "write")', (x, self.addr))
-        c.close()
-        connection.commit()
+            yield (x, self.addr, 'write')
+
+    def save(self, connection):
+        saveProcInfos(connection, [self])
 
     def render(self, renderer):
         pass
 
+def loadCallers(c, addr):
+    c.execute('select source from calls where destination=?', (addr,))
+    return set(src for src, in c.fetchall())
+
+def saveProcInfos(connection, infos):
+    """Write a batch of ProcInfo objects in a single transaction."""
+    infos = list(infos)
+    addrs = [(info.addr,) for info in infos]
+    with connection:
+        c = connection.cursor()
+        c.executemany('insert or replace into procs(addr, type, depset, has_switch, suspicious_switch, has_suspicious_instr, has_nop, has_ambig_calls, length) values (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                      [info.procRow() for info in infos])
+        c.executemany('delete from calls where source=?', addrs)
+        c.executemany('delete from memref where proc=?', addrs)
+        c.executemany('insert or ignore into calls(source, destination, type) values (?, ?, ?)', chain.from_iterable(info.callRows() for info in infos))
+        c.executemany('insert or ignore into memref(addr, proc, type) values (?, ?, ?)', chain.from_iterable(info.memrefRows() for info in infos))
+        c.close()
+
 class Database(object):
     default_tags = {
         'IO:FF04': 'IO:DIV',
@@ -136,35 +183,102 @@ class Database(object):
         'IO:FF0F': 'IO:IF',
     }
 
+    # pending proc updates are written once this many are queued, or this many seconds after the last flush
+    flush_batch = 256
+    flush_interval = 5.0
+
     def __init__(self, filename):
+        self.filename = filename
         self.connection = sqlite3.connect(filename, detect_types=sqlite3.PARSE_DECLTYPES)
 
         c = self.connection.cursor()
-        c.execute('create table if not exists procs(addr address, type text, depset text, has_switch integer, suspicious_switch integer, has_suspicious_instr integer, has_nop integer, has_ambig_calls integer, length integer)')
-        c.execute('create table if not exists calls(source address, destination address, type text)')
-        c.execute('create table if not exists memref(addr address, proc address, type text)')
-        c.execute('create table if not exists tags(addr address, name text)')
+        c.execute('pragma journal_mode=wal')
+        c.execute('pragma synchronous=normal')
+        c.execute('create table if not exists procs(addr address primary key, type text, depset text, has_switch integer, suspicious_switch integer, has_suspicious_instr integer, has_nop integer, has_ambig_calls integer, length integer)')
+        c.execute('create table if not exists calls(source address, destination address, type text, unique(source, destination, type))')
+        c.execute('create index if not exists calls_destination on calls(destination)')
+        c.execute('create table if not exists memref(addr address, proc address, type text, unique(addr, proc, type))')
+        c.execute('create index if not exists memref_proc on memref(proc)')
+        c.execute('create table if not exists tags(addr address primary key, name text)')
+        c.execute('create table if not exists ownership(bank integer primary key, runs blob)')
+
+        self.ownership = OwnershipMap()
+        c.execute('select bank, runs from ownership')
+        for bank, runs in c.fetchall():
+            self.ownership.decodeBank(bank, runs)
+
         c.close()
         self.connection.commit()
+        self.reloadProcIndex()
+
+        self.pending = dict()
+        self.dirty_banks = set()
+        # whether procInfo answers from a snapshot, which is loaded by the first procInfo
+        self.preload = False
+        self.preloaded = None
+        self.last_flush = time.time()
+
+        # bumped whenever a symbol name changes, for caches of rendered output
+        self.symbols_version = 0
+        self.loadSymbols()
 
     def close(self):
+        self.flush()
         self.connection.close()
 
-    def hasNameForAddress(self, addr):
-        if str(addr) in self.default_tags:
-            return True
+    def reconnect(self):
+        """
+        Continue on a new connection to the same file, for a process forked after this database was opened.
+        The inherited connection must not be used nor closed there, so it is only kept alive.
+        """
+        self.inherited_connection = self.connection
+        self.connection = sqlite3.connect(self.filename, detect_types=sqlite3.PARSE_DECLTYPES)
 
+    def reloadProcIndex(self):
+        """Read the sorted index of proc addresses, also to pick up procs added through another connection."""
         with closing(self.connection.cursor()) as c:
-            c.execute('select name from tags where addr=?', (addr,))
-            return bool(getFirst(c.fetchone()))
+            c.execute('select addr from procs')
+            self.proc_index = sorted(set(x[0].address for x in c.fetchall()))
+
+    def setReadOnly(self):
+        """Refuse all writes on this connection, for readers that run next to another process writing the database."""
+        self.connection.execute('pragma query_only=1')
+
+    def flush(self):
+        """Write all queued proc updates and ownership changes."""
+        if self.pending:
+            saveProcInfos(self.connection, self.pending.values())
+            self.pending = dict()
+        if self.dirty_banks:
+            with self.connection:
+                self.connection.executemany('insert or replace into ownership(bank, runs) values (?, ?)',
+                                            [(bank, sqlite3.Binary(self.ownership.encodeBank(bank))) for bank in self.dirty_banks])
+            self.dirty_banks = set()
+        self.last_flush = time.time()
+
+    def flushIfDue(self):
+        """Flush once flush_batch updates are queued or flush_interval has passed since the last flush."""
+        if len(self.pending) >= self.flush_batch:
+            self.flush()
+        elif (self.pending or self.dirty_banks) and time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def loadSymbols(self):
+        """Read tags into the in-memory symbol table. default_tags take precedence over stored names."""
+        with closing(self.connection.cursor()) as c:
+            c.execute('select addr, name from tags')
+            self.symbols = dict(c.fetchall())
+        self.default_symbols = dict((address.fromConventional(k), v) for k, v in self.default_tags.items())
+        self.symbols.update(self.default_symbols)
+        self.symbols_version += 1
 
-    def nameForAddress(self, addr):
-        if str(addr) in self.default_tags:
-            return self.default_tags[str(addr)]
+    def hasNameForAddress(self, addr):
+        return bool(self.symbols.get(addr))
 
-        with closing(self.connection.cursor()) as c:
-            c.execute('select name from tags where addr=?', (addr,))
-            return getFirst(c.fetchone(), str(addr))
+    def nameForAddress(self, addr):
+        if addr in self.symbols:
+            return self.symbols[addr]
+        return str(addr)
 
     def setNameForAddress(self, addr, name):
         c = self.connection.cursor()
@@ -178,45 +292,173 @@ class Database(object):
         c.close()
         self.connection.commit()
 
+        if addr not in self.default_symbols:
+            self.symbols[addr] = name
+            self.symbols_version += 1
+
     def procInfo(self, addr):
-        return ProcInfo(self.connection, addr)
+        """Info of the proc at addr. The result is the caller's own copy, changes take effect through saveProcInfo."""
+        self.flushIfDue()
+        if self.preload:
+            if self.preloaded is None:
+                self.preloaded = self.loadProcInfos()
+            info = self.preloaded.get(addr)
+            if info is not None:
+                return info.copy()
+
+        info = self.pending.get(addr.address)
+        if info is None:
+            info = ProcInfo(self.connection, addr)
+        else:
+            info = info.copy()
+            with closing(self.connection.cursor()) as c:
+                info.callers = loadCallers(c, addr)
+
+        if self.pending:
+            for pending in self.pending.values():
+                if addr in pending.calls or addr in pending.tail_calls:
+                    info.callers.add(pending.addr)
+                else:
+                    info.callers.discard(pending.addr)
+        return info
+
+    def loadProcInfos(self, bank=None):
+        """Load infos of all procs, or all procs in bank, with a handful of set-based queries. Returns a dict keyed by address."""
+        self.flush()
+        if bank is None:
+            scope = ''
+            args = ()
+        else:
+            scope = ' where {0}>=? and {0}<?'
+            args = bankRange(bank)
+
+        infos = dict()
+        with closing(self.connection.cursor()) as c:
+            c.execute('select addr, ' + PROC_COLUMNS + ' from procs' + scope.format('addr'), args)
+            for row in c:
+                infos[row[0]] = ProcInfo(None, row[0], row[1:])
+
+            c.execute('select source, destination, type from calls' + scope.format('source'), args)
+            for source, dest, calltype in c:
+                if source in infos:
+                    infos[source].addCall(dest, calltype)
+
+            c.execute('select addr, proc, type from memref' + scope.format('proc'), args)
+            for ref, proc, reftype in c:
+                if proc in infos:
+                    infos[proc].addMemref(ref, reftype)
+
+            c.execute('select source, destination from calls' + scope.format('destination'), args)
+            for source, dest in c:
+                if dest in infos:
+                    infos[dest].callers.add(source)
+        return infos
+
+    def preloadProcInfos(self):
+        """Answer procInfo from a whole-database snapshot until the next save. Meant for read-only passes such as export."""
+        self.preload = True
+
+    def saveProcInfo(self, info):
+        """Queue a copy of info for writing. Queued infos are visible to procInfo before they are flushed."""
+        info = info.copy()
+        # keep the depset in the form it reads back from the table
+        info.depset = decodeDependencySet(encodeDependencySet(info.depset))
+        self.preload = False
+        self.preloaded = None
+        self.pending[info.addr.address] = info
+        self.flushIfDue()
+        i = bisect_left(self.proc_index, info.addr.address)
+        if i == len(self.proc_index) or self.proc_index[i] != info.addr.address:
+            self.proc_index.insert(i, info.addr.address)
 
     def reportProc(self, addr):
-        ProcInfo(self.connection, addr).save(self.connection)
+        self.saveProcInfo(self.procInfo(addr))
+
+    def setOwnership(self, addr, runs):
+        """Record the bytes owned by the procedure at addr, as (address, length, kind) runs. Written on the next flush."""
+        self.dirty_banks.add(self.ownership.setOwner(addr, runs))
+
+    def getOwners(self, addr):
+        return self.ownership.ownersAt(addr)
+
+    def getOwnershipConflicts(self, bank):
+        return self.ownership.conflicts(bank)
+
+    def getCoverage(self, bank):
+        return self.ownership.coverage(bank)
 
     def getNextOwnedAddress(self, addr):
-        with closing(self.connection.cursor()) as c:
-            c.execute('select addr from procs where addr > ? order by addr', (addr,))
-            return getFirst(c.fetchone())
+        """First known procedure start after addr, from the in-memory index."""
+        i = bisect_right(self.proc_index, addr.address)
+        if i < len(self.proc_index):
+            return address.Address(self.proc_index[i])
+
+    def getPrevOwnedAddress(self, addr):
+        """Last known procedure start before addr, from the in-memory index."""
+        i = bisect_left(self.proc_index, addr.address)
+        if i > 0:
+            return address.Address(self.proc_index[i-1])
 
     def getUnfinished(self):
+        self.flush()
         with closing(self.connection.cursor()) as c:
             c.execute('select addr from procs where has_ambig_calls=1 and suspicious_switch=0 and has_suspicious_instr=0')
             return [x[0] for x in c.fetchall()]
 
+    def getEncodedDepsets(self, addrs):
+        """Stored dependency sets of the procs at addrs, in the text form of depend.encodeDependencySet, keyed by address. Unknown procs are left out."""
+        self.flush()
+        out = dict()
+        with closing(self.connection.cursor()) as c:
+            for addr in addrs:
+                c.execute('select depset from procs where addr=?', (addr,))
+                row = c.fetchone()
+                if row is not None:
+                    out[addr] = row[0]
+        return out
+
     def getAll(self):
+        self.flush()
         with closing(self.connection.cursor()) as c:
             c.execute('select addr from procs order by addr')
             return [x[0] for x in c.fetchall()]
 
     def getAllInBank(self, bank):
-        bank_name = "{:04X}".format(bank)
+        self.flush()
         with closing(self.connection.cursor()) as c:
-            c.execute('select addr from procs where substr(addr, 0, 5)=? order by addr', (bank_name,))
+            c.execute('select addr from procs where addr>=? and addr<? order by addr', bankRange(bank))
             return [x[0] for x in c.fetchall()]
 
+    def getCallDestinations(self):
+        self.flush()
+        with closing(self.connection.cursor()) as c:
+            c.execute('select distinct destination from calls order by destination')
+            return [x[0] for x in c.fetchall()]
+
+    def getCallGraph(self):
+        """Callees of every proc that has recorded calls, as a dict of sets keyed by the caller."""
+        self.flush()
+        graph = dict()
+        with closing(self.connection.cursor()) as c:
+            c.execute('select source, destination from calls')
+            for source, dest in c:
+                graph.setdefault(source, set()).add(dest)
+        return graph
+
     def setInitial(self, initial):
         c = self.connection.cursor()
-        c.executemany('insert into calls(source, destination) values ("FFFF:0000", ?)', ((x,) for x in initial))
+        c.executemany('insert or ignore into calls(source, destination, type) values (?, ?, "call")', ((INITIAL_CALLER, x) for x in initial))
         c.close()
         self.connection.commit()
 
     def getAmbigCalls(self):
+        self.flush()
         with closing(self.connection.cursor()) as c:
             c.execute('select addr from procs where has_ambig_calls=1')
             return [x[0] for x in c.fetchall()]
 
     def getDataReferers(self, data_addr):
+        self.flush()
         reads = set()
         writes = set()
         c = self.connection.cursor()
@@ -254,18 +496,15 @@ class Database(object):
             y = i // width
             img.putpixel((x, y), color)
 
-        c = self.connection.cursor()
-        c.execute('select addr, length from procs order by addr')
-        for addr, length in c.fetchall():
-            for i in range(length):
-                byte_addr = addr.offset(i).physical()
-
-                x = byte_addr % width
-                y = byte_addr // width
-                color = (0, 255, 0)
-                img.putpixel((x, y), color)
+        for bank in self.ownership.banks:
+            for start, end, owner, kind in self.ownership.banks[bank]:
+                for virtual in range(start, end):
+                    byte_addr = address.fromVirtualAndBank(virtual, bank).physical()
 
-        c.close()
+                    x = byte_addr % width
+                    y = byte_addr // width
+                    color = (0, 255, 0)
+                    img.putpixel((x, y), color)
 
         img.save('data/ownership.png')
         print('image saved')
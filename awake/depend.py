@@ -14,46 +14,59 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from awake.regutil import joinRegisters, splitRegisters, ALL_REGS
+from awake.regutil import ALL_REGS_MASK, isRegister, joinRegisters, maskNames, registerMask, splitRegisters
 
 def joinDependencies(first, second):
-    reads = second.reads - first.writes | first.reads
+    reads = second.reads & ~first.writes | first.reads
     writes = first.writes | second.writes
-    return DependencySet(reads, writes)
+    return DependencySet(reads, writes, first.addresses | second.addresses)
 
 def dependParallel(a, b):
     reads = a.reads | b.reads
     writes = a.writes | b.writes
-    return DependencySet(reads, writes)
+    return DependencySet(reads, writes, a.addresses | b.addresses)
 
 def unknownDependencySet():
-    return DependencySet(ALL_REGS - set(['FZ', 'FC', 'FN', 'FH']), ALL_REGS - set(['ROMBANK']))
+    return DependencySet(ALL_REGS_MASK & ~registerMask(['FZ', 'FC', 'FN', 'FH']), ALL_REGS_MASK & ~registerMask(['ROMBANK']))
+
+def dependencySetFromNames(reads=(), writes=()):
+    """DependencySet of register and address names. Addresses are only ever read."""
+    addresses = frozenset(x for x in reads if not isRegister(x))
+    return DependencySet(registerMask(reads), registerMask(writes), addresses)
 
 class DependencySet:
-    def __init__(self, reads=None, writes=None):
-        if reads:
-            self.reads = reads
-        else:
-            self.reads = set()
-        if writes:
-            self.writes = writes
-        else:
-            self.writes = set()
+    """
+    Registers read and written by a piece of code, as register masks (see regutil.registerMask).
+    Memory addresses that are read have no bits and are kept by name in addresses.
+    """
+
+    def __init__(self, reads=0, writes=0, addresses=frozenset()):
+        self.reads = reads
+        self.writes = writes
+        self.addresses = addresses
+
+    def readNames(self):
+        return maskNames(self.reads) | self.addresses
+
+    def writeNames(self):
+        return maskNames(self.writes)
 
     def __str__(self):
-        return 'DependencySet({0}, {1})'.format(joinRegisters(self.reads), joinRegisters(self.writes))
+        return 'DependencySet({0}, {1})'.format(joinRegisters(self.readNames()), joinRegisters(self.writeNames()))
 
     def onlyRegisters(self):
-        return DependencySet(self.reads & ALL_REGS, self.writes & ALL_REGS)
+        return DependencySet(self.reads & ALL_REGS_MASK, self.writes & ALL_REGS_MASK)
 
 def encodeDependencySet(depset):
-    return ", ".join(str(x) for x in joinRegisters(depset.reads)) + " -> " + ", ".join(str(x) for x in joinRegisters(depset.writes))
+    """Text form of depset. Equal sets always encode to the same text, so it is also used to compare them."""
+    reads = sorted(set(str(x) for x in joinRegisters(depset.readNames())))
+    writes = sorted(set(str(x) for x in joinRegisters(depset.writeNames())))
+    return ", ".join(reads) + " -> " + ", ".join(writes)
 
 def decodeDependencySet(text):
     if not text:
         return DependencySet()
     r, w = text.split("->")
-    reads = set(x.strip() for x in r.split(","))
-    writes = set(x.strip() for x in w.split(","))
-    return DependencySet(splitRegisters(reads), splitRegisters(writes))
-
+    reads = set(x.strip() for x in r.split(",") if x.strip())
+    writes = set(x.strip() for x in w.split(",") if x.strip())
+    return dependencySetFromNames(splitRegisters(reads), splitRegisters(writes))
@@ -14,6 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import defaultdict
+from awake import address
+from awake.depend import decodeDependencySet, unknownDependencySet
 from awake.opcodedispatcher import OpcodeDispatcher
 
 main_ops = """
@@ -106,13 +109,101 @@ cb_ops = """
 11IIISSS 2 SET  #I, #S                @ read: #S         write: #S:(#S | (1<<#I));
 """
 
+class FlowStep(object):
+    """Control flow summary of a single instruction: length, fallthrough and targets."""
+
+    def __init__(self, addr, name, next_addr, has_continue=True):
+        self.addr = addr
+        self.name = name
+        self.next_addr = next_addr
+        self.has_continue = has_continue
+        self.is_switch = False
+        self.all_jumps = []
+        self.jumps = []
+        self.calls = []
+
+    def __str__(self):
+        return self.name
+
+class OpcodeFlow(object):
+    """Control flow properties of one opcode, precomputed from its decode record."""
+
+    def __init__(self, record):
+        self.name = record.name
+        self.length = record.length
+        self.kind = None
+        self.conditional = False
+        self.argument = None
+        self.target = None
+
+        if record.name in ('JP', 'CALL'):
+            self.kind = record.name
+            self.conditional = len(record.operands) == 2
+            template = record.operands[0]
+            if not template.static:
+                self.argument = str(template.expr)
+            else:
+                self.target = template.expr.value
+        elif record.name in ('RET', 'RETI'):
+            self.kind = 'RET'
+            self.conditional = bool(record.operands)
+
+    def targetValue(self, rom, addr, next_addr):
+        if self.argument == 'v8_rel':
+            offset = rom.get(addr.offset(1))
+            if offset & 0x80:  # convert to signed offset
+                offset -= 0x100
+            return (next_addr.virtual() + offset) & 0xFFFF
+        elif self.argument == 'v16':
+            return rom.get_word(addr.offset(1))
+        return self.target
+
+    def step(self, rom, addr, prefix_length=0):
+        next_addr = addr.offset(prefix_length + self.length)
+        step = FlowStep(addr, self.name, next_addr)
+
+        if self.kind == 'RET':
+            step.has_continue = self.conditional
+
+        elif self.kind == 'JP':
+            step.has_continue = self.conditional
+            value = self.targetValue(rom, addr, next_addr)
+            if value is not None:
+                target = address.fromVirtualAndCurrent(value, addr)
+                step.all_jumps = [target]
+                if not target.isAmbiguous():
+                    step.jumps = [target]
+
+        elif self.kind == 'CALL':
+            value = self.targetValue(rom, addr, next_addr)
+
+            # XXX: IDIOM, see instruction.make
+            if value == 0 and not self.conditional:
+                step.name = 'switch'
+                step.is_switch = True
+                step.has_continue = False
+
+            # XXX: IDIOMS [CALL HL], [CALL BC], [CALL LONG E:HL], see CallInstruction
+            elif value is not None and value not in (0x00A0, 0x0CDA, 0x008A):
+                target = address.fromVirtualAndCurrent(value, addr)
+                if target.inPhysicalMem() and not target.isAmbiguous():
+                    step.calls = [target]
+
+        return step
+
+def flowTable(dispatcher):
+    return [OpcodeFlow(record) if record else None for record in dispatcher.dispatchTable]
+
 class Z80Disasm(object):
     def __init__(self, proj):
         self.proj = proj
         self.main = OpcodeDispatcher(main_ops.splitlines())
         self.cb = OpcodeDispatcher(cb_ops.splitlines())
+        self.main_flow = flowTable(self.main)
+        self.cb_flow = flowTable(self.cb)
         self.cache = dict()
         self.next_addr_cache = dict()
+        self.call_sites = defaultdict(set)
 
     def _decode(self, addr):
         opcode = self.proj.rom.get(addr)
@@ -124,4 +215,47 @@ class Z80Disasm(object):
     def decodeCache(self, addr):
         if addr not in self.cache:
             self.cache[addr], self.next_addr_cache[addr] = self._decode(addr)
+            if hasattr(self.cache[addr], 'target_depset'):
+                self.call_sites[self.cache[addr].targetAddr].add(addr)
         return self.cache[addr], self.next_addr_cache[addr]
+
+    def invalidateCallsTo(self, target):
+        """Forget decoded calls to target, so they pick up its new dependency set."""
+        for addr in self.call_sites.pop(target, ()):
+            self.cache.pop(addr, None)
+            self.next_addr_cache.pop(addr, None)
+
+    def invalidateChangedCalls(self, depsets):
+        """
+        Forget decoded calls to procs whose dependency set is no longer the one in depsets
+        (encoded, see Database.getEncodedDepsets), for a process that does not see the saves.
+        """
+        for target, sites in self.call_sites.items():
+            if target in depsets:
+                current = decodeDependencySet(depsets[target])
+            else:
+                current = unknownDependencySet()
+            for addr in sites:
+                instr = self.cache.get(addr)
+                if instr is None:
+                    continue
+                old = instr.target_depset
+                if (old.reads, old.writes, old.addresses) != (current.reads, current.writes, current.addresses):
+                    self.invalidateCallsTo(target)
+                    break
+
+    def decodeFlow(self, addr):
+        """Decode only the control flow of the instruction at addr, without building an Instruction."""
+        rom = self.proj.rom
+        opcode = rom.get(addr)
+        if opcode == 0xCB:
+            flow = self.cb_flow[rom.get(addr.offset(1))]
+            prefix_length = 1
+        else:
+            flow = self.main_flow[opcode]
+            prefix_length = 0
+
+        if not flow:
+            print('WARN: bad opcode', addr)
+            return FlowStep(addr, 'BAD-OP', None, False)
+        return flow.step(rom, addr, prefix_length)
@@ -0,0 +1,290 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import time
+from collections import deque
+from awake import address, procedure
+from awake.depend import dependParallel, encodeDependencySet
+
+# cartridge entry point followed by the vblank, lcd stat, timer, serial and joypad interrupt vectors
+ENTRY_POINTS = [address.fromVirtual(x) for x in (0x100, 0x40, 0x48, 0x50, 0x58, 0x60)]
+
+# analyses of a proc after which its dependency set is only allowed to grow
+WIDEN_AFTER = 4
+
+def defaultSeeds(database):
+    """Entry points, every known proc and every recorded call destination, without duplicates."""
+    seeds = list(ENTRY_POINTS)
+    seeds += database.getAll()
+    seeds += database.getCallDestinations()
+    seen = set()
+    out = []
+    for addr in seeds:
+        if addr not in seen and addr.inPhysicalMem():
+            seen.add(addr)
+            out.append(addr)
+    return out
+
+def callGraphComponents(graph):
+    """
+    Strongly connected components of graph, a dict from each proc to the set of its callees.
+
+    Tarjan's algorithm without recursion. Components come out callees first.
+    """
+    index = dict()
+    lowlink = dict()
+    stack = []
+    on_stack = set()
+    components = []
+
+    def visit(x):
+        index[x] = lowlink[x] = len(index)
+        stack.append(x)
+        on_stack.add(x)
+        return (x, iter(sorted(graph.get(x, ()))))
+
+    for root in sorted(graph):
+        if root in index:
+            continue
+        work = [visit(root)]
+        while work:
+            x, todo = work[-1]
+            for y in todo:
+                if y not in index:
+                    work.append(visit(y))
+                    break
+                elif y in on_stack:
+                    lowlink[x] = min(lowlink[x], index[y])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[x])
+                if lowlink[x] == index[x]:
+                    component = []
+                    while True:
+                        y = stack.pop()
+                        on_stack.discard(y)
+                        component.append(y)
+                        if y == x:
+                            break
+                    components.append(component)
+    return components
+
+def callGraphSchedule(graph):
+    """
+    Position of every proc of graph in a bottom-up analysis order, as (wave, component, member) tuples.
+
+    Callees come before their callers, so the dependency sets a proc is analysed with are
+    usually final. Procs calling each other share a component and a wave. Procs of one wave
+    do not call each other outside of their component, so they can be analysed independently.
+    """
+    order = dict()
+    for n, component in enumerate(callGraphComponents(graph)):
+        members = set(component)
+        wave = 0
+        for x in component:
+            for c in graph.get(x, ()):
+                if c not in members:
+                    wave = max(wave, order[c][0] + 1)
+        for i, x in enumerate(component):
+            order[x] = (wave, n, i)
+    return order
+
+class DiscoveryStats(object):
+    def __init__(self):
+        self.seeds = 0
+        self.procs = 0
+        self.discovered = 0
+        self.analyses = 0
+        self.reanalyses = 0
+        self.depset_changes = 0
+        self.widened = 0
+        self.waves = 0
+        self.max_analyses = 0
+        self.failed = 0
+        self.converged = False
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return ('{0} procs ({1} seeds, {2} discovered), {3} analyses in {4} waves ({5} repeated, at most {6} of one proc), '
+                '{7} depset changes ({8} widened), {9} failed, {10} in {11:.2f}s').format(
+            self.procs, self.seeds, self.discovered, self.analyses, self.waves, self.reanalyses, self.max_analyses,
+            self.depset_changes, self.widened, self.failed, 'converged' if self.converged else 'NOT converged', self.elapsed)
+
+class Discovery(object):
+    """
+    Worklist of procs to analyse until no dependency set changes anymore.
+
+    The queue is worked off in waves, bottom-up along the known call graph (see
+    callGraphSchedule). It starts out as the calls table, and procs not in there
+    are scanned for calls before they are scheduled. A proc is analysed when it
+    is first found and again whenever one of its callees ends up with a different
+    dependency set. Recursive procs can make the sets oscillate, so after
+    WIDEN_AFTER analyses a proc keeps the union of its old and new set. Stops
+    early after max_steps analyses.
+    """
+
+    def __init__(self, proj, seeds=None, max_steps=None, report=None):
+        self.proj = proj
+        self.database = proj.database
+        if seeds is None:
+            seeds = defaultSeeds(self.database)
+        self.max_steps = max_steps
+        self.report = report
+
+        self.stats = DiscoveryStats()
+        self.stats.seeds = len(seeds)
+        self.start_time = time.time()
+
+        self.procs = set(seeds)
+        self.analyses = dict()
+        self.queue = deque(seeds)
+        self.queued = set(seeds)
+
+        self.graph = self.database.getCallGraph()
+        self.order = None
+        # procs of the current wave that have not been recorded yet
+        self.pending = set()
+
+    def stepsLeft(self):
+        if self.max_steps is None:
+            return len(self.queue)
+        return max(0, min(len(self.queue), self.max_steps - self.stats.analyses))
+
+    def next(self):
+        x = self.queue.popleft()
+        self.queued.discard(x)
+        return x
+
+    def position(self, x):
+        # procs with no known calls can't be placed, analyse them first to learn more
+        return self.order.get(x, (0, -1, 0))
+
+    def scan(self):
+        """Find direct callees of queued procs with no known calls from their code alone, queueing new ones too."""
+        todo = [x for x in self.queue if x not in self.graph]
+        while todo:
+            x = todo.pop()
+            try:
+                calls = procedure.loadProcedureRange(self.proj, x).calls()
+            except Exception:
+                calls = set()  # reported when the proc is analysed
+            self.graph[x] = calls
+            self.order = None
+            for c in calls:
+                if self.found(c):
+                    todo.append(c)
+
+    def nextWave(self):
+        """Queued procs of the lowest wave, at most stepsLeft() of them. They don't depend on each other, except within recursive components."""
+        self.scan()
+        if self.order is None:
+            self.order = callGraphSchedule(self.graph)
+        self.queue = deque(sorted(self.queue, key=self.position))
+        wave = self.position(self.queue[0])[0]
+        batch = []
+        limit = self.stepsLeft()
+        while self.queue and len(batch) < limit and self.position(self.queue[0])[0] == wave:
+            batch.append(self.next())
+        self.stats.waves += 1
+        self.pending = set(batch)
+        return batch
+
+    def found(self, x):
+        """Queue x if it is a proc not seen before."""
+        if x in self.procs or not x.inPhysicalMem():
+            return False
+        self.stats.discovered += 1
+        self.database.reportProc(x)
+        self.enqueue(x)
+        return True
+
+    def enqueue(self, x):
+        if x not in self.queued and x not in self.pending:
+            self.procs.add(x)
+            self.queue.append(x)
+            self.queued.add(x)
+
+    def analyze(self, x):
+        """Analyse x in this process and record the result."""
+        old_depset = self.database.procInfo(x).depset
+        try:
+            proc = self.proj.flow.refresh(x)
+        except Exception as e:
+            self.fail(x, '{0}: {1}'.format(type(e).__name__, e))
+            return
+        self.update(x, old_depset, proc)
+
+    def fail(self, x, error):
+        self.pending.discard(x)
+        print('WARN: analysis failed at {0}: {1}'.format(x, error))
+        self.stats.failed += 1
+
+    def update(self, x, old_depset, proc):
+        """Queue whatever the new analysis of x affects. proc is already saved to the database. Returns True when the depset changed."""
+        database = self.database
+        stats = self.stats
+        old_deps = encodeDependencySet(old_depset)
+        self.pending.discard(x)
+
+        self.analyses[x] = self.analyses.get(x, 0) + 1
+        stats.analyses += 1
+        if self.report and stats.analyses % 100 == 0:
+            self.report(stats.analyses, len(self.queue), 'Analyzing proc: ' + str(x))
+
+        calls = proc.calls() | proc.tailCalls()
+        if self.graph.get(x) != calls:
+            self.graph[x] = set(calls)
+            self.order = None
+
+        for c in calls:
+            self.found(c)
+
+        depset = proc.getDependencySet()
+        if encodeDependencySet(depset) != old_deps and self.analyses[x] > WIDEN_AFTER:
+            depset = dependParallel(old_depset, depset)
+            info = database.procInfo(x)
+            info.depset = depset
+            database.saveProcInfo(info)
+            stats.widened += 1
+
+        if encodeDependencySet(depset) != old_deps:
+            stats.depset_changes += 1
+            for caller in database.procInfo(x).callers:
+                if caller.inPhysicalMem():
+                    self.enqueue(caller)
+            return True
+        return False
+
+    def finish(self):
+        self.database.flush()
+        stats = self.stats
+        stats.converged = not self.queue
+        stats.procs = len(self.procs)
+        stats.reanalyses = stats.analyses - len(self.analyses)
+        stats.max_analyses = max(self.analyses.values()) if self.analyses else 0
+        stats.elapsed = time.time() - self.start_time
+        return stats
+
+def discover(proj, seeds=None, max_steps=None, report=None):
+    """Analyse every proc reachable from seeds until no dependency set changes anymore. See Discovery."""
+    discovery = Discovery(proj, seeds, max_steps, report)
+    while discovery.stepsLeft():
+        for x in discovery.nextWave():
+            discovery.analyze(x)
+    return discovery.finish()
@@ -72,8 +72,10 @@ class ExportTask(AsyncTask):
 
         if self.scope == 'all':
             procs = sorted(database.getAll())
+            database.preloadProcInfos()
         elif self.scope == 'bank':
             procs = sorted(database.getAllInBank(self.bank))
+            database.preloadProcInfos()
         elif self.scope == 'proc':
             procs = [address.fromConventional(self.address)]
         else:
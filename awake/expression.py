@@ -133,11 +133,19 @@ def lookup(lexer):
     lexer.push_token(token)
     return token
 
+_parsed = dict()
+
 def parse(text):
+    """Expression tree for text. Trees are interned and immutable, so they are parsed once per text."""
+    if text in _parsed:
+        return _parsed[text]
     try:
         lexer = shlex.shlex(text)
         lexer.commenters = ''
         lexer.wordchars += '#'
-        return expression(lexer)
+        out = expression(lexer)
     except ExpressionError as e:
         print('ERROR:', e.msg, 'in', text)
+        return None
+    _parsed[text] = out
+    return out
@@ -14,117 +14,177 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from awake import address, flowcontrol, procedure
 from awake.context import Context
-from awake.depend import DependencySet
+from awake.depend import DependencySet, encodeDependencySet
+from awake.flowstore import FlowStore
+from awake.liveness import Liveness
+from awake.ssa import ConstantPropagation
 from awake.operand import Constant
-from awake.regutil import ALL_REGS
+from awake.regutil import ALL_REGS_MASK, FLAGS_MASK
 
 def select_any(x):
     return next(iter(x), None)
 
+def dfs_postorder(graph):
+    """Vertices reachable from the start, in depth-first postorder. Childs are visited in order, None like any other vertex."""
+    offsets, succ = graph.successors()
+    exit = graph.EXIT
+    start = graph.start()
+    order = []
+    visited = bytearray(graph.numBlocks())
+    visited[start] = 1
+    exit_visited = False
+    stack = [[start, offsets[start]]]
+    while stack:
+        top = stack[-1]
+        x, i = top
+        end = offsets[x+1]
+        while i < end:
+            ch = succ[i]
+            i += 1
+            if ch == exit:
+                if not exit_visited:
+                    exit_visited = True
+                    order.append(None)
+            elif not visited[ch]:
+                visited[ch] = 1
+                top[1] = i
+                stack.append([ch, offsets[ch]])
+                break
+        else:
+            stack.pop()
+            order.append(x)
+    return order
+
 def find_merge_points(graph):
     """Produce a dict of vert->end_points for each fork vert. End points are places, where fork branches merge"""
-    queue = set([graph.start()])
-    visited = set()
-    branches = defaultdict(set)
-
-    def _update(x, parent):
-        updated = False
-        for br in branches[parent]:
-            if br == (x, 0) or br == (x, 1):
-                continue
-            if br not in branches[x]:
-                branches[x].add(br)
-                updated = True
-        return updated
-
-    while queue:
-        x = queue.pop()
-        childs = graph.childs(x)
-
-        visited.add(x)
-
-        if len(childs) > 1:
-            i = 0
-            for ch in childs:
-                branchtag = (x, i)
-                if branchtag not in branches[ch]:
-                    branches[ch].add(branchtag)
-                    queue.add(ch)
-                i += 1
-
-        for ch in childs:
-            updated = _update(ch, x)
-            if updated or ch not in visited:
-                queue.add(ch)
+
+    # every branch of a fork gets a bit, tags[x] holds the bits of branches that reach x
+    offsets, succ = graph.successors()
+    pred_offsets, pred = graph.predecessors()
+    exit = graph.EXIT
+    num_blocks = graph.numBlocks()
+    order = [x for x in reversed(dfs_postorder(graph)) if x is not None]
+
+    base = dict()
+    fork_at = dict()
+    pairs = 0
+    multiway = []
+    num_bits = 0
+    for x in order:
+        num_childs = offsets[x+1] - offsets[x]
+        if num_childs > 1:
+            base[x] = num_bits
+            fork_at[num_bits] = x
+            if num_childs == 2:
+                pairs |= 1 << num_bits
+            else:
+                multiway.append((num_bits, (1 << num_childs) - 1))
+            num_bits += num_childs
+
+    # tags of the first two branches of a fork do not flow through the fork itself
+    keep = [-1] * num_blocks
+    for x in base:
+        keep[x] = ~(3 << base[x])
+
+    tags = [0] * num_blocks
+    for x in base:
+        for i in xrange(offsets[x], offsets[x+1]):
+            ch = succ[i]
+            if ch != exit:
+                tags[ch] |= 1 << (base[x] + i - offsets[x])
+
+    # edges between reachable blocks, in the order of the sweeps
+    edges = []
+    for x in order:
+        for i in xrange(offsets[x], offsets[x+1]):
+            ch = succ[i]
+            if ch != exit:
+                edges.append((x, ch))
+
+    # sweep in reverse postorder until nothing changes, loop nesting depth + 1 sweeps on reducible graphs
+    changed = True
+    while changed:
+        changed = False
+        for x, ch in edges:
+            updated = tags[ch] | (tags[x] & keep[ch])
+            if updated != tags[ch]:
+                tags[ch] = updated
+                changed = True
+
+    # a fork joins at x when all its branches reach x, or at least three of them
+    def _joins(t):
+        out = t & (t >> 1) & pairs
+        for b, mask in multiway:
+            if bin((t >> b) & mask).count('1') >= 3:
+                out |= 1 << b
+        return out
+
+    joins = [_joins(t) for t in tags]
 
     merges = defaultdict(set)
 
-    for x in graph.vertices():
-        joined = set()
-        for (vert, _) in branches[x]:
-
-            def _has_join(x, vert):
-                #return all(((vert, i) in branches[x]) for i in range(len(graph.childs(vert))))
-                count = 0
-                for i in range(len(graph.childs(vert))):
-                    if (vert, i) in branches[x]:
-                        count += 1
-                return count == len(graph.childs(vert)) or count >= 3
-                """
-                return (vert, 0) in branches[x] and (vert, 1) in branches[x]
-                """
-
-            if not _has_join(x, vert):
-                continue
+    for x in xrange(num_blocks):
+        joined = joins[x]
+        if not joined:
+            continue
 
-            for p in graph.parents(x):
-                if not _has_join(p, vert):
-                    joined.add(vert)
-                    break
+        lo, hi = pred_offsets[x], pred_offsets[x+1]
+        if lo == hi:
+            continue
+        common = joins[pred[lo]]
+        for i in xrange(lo + 1, hi):
+            common &= joins[pred[i]]
 
-        for y in joined:
-            merges[y].add(x)
+        joined &= ~common
+        while joined:
+            low = joined & -joined
+            merges[fork_at[low.bit_length() - 1]].add(x)
+            joined ^= low
 
     return merges
 
+class Cycle(tuple):
+    """Verts of a cycle. Hashes like the plain tuple, but only computes it once."""
+
+    def __new__(cls, verts):
+        self = tuple.__new__(cls, verts)
+        self.hash = tuple.__hash__(self)
+        return self
+
+    def __hash__(self):
+        return self.hash
+
 def find_cycles(graph):
     """Produce a dict of vert -> set of cycles, associating each vertex with cycles it lies on"""
-    visited = set()
-    stack = []
-
-    def _first_dfs(x):
-        visited.add(x)
-        for ch in graph.childs(x):
-            if ch not in visited:
-                _first_dfs(ch)
-        stack.append(x)
 
-    _first_dfs(graph.start())
+    # in reverse postorder, the verts that reach x without passing an earlier vert form the loop headed by x
+    # the exit has no childs, so it heads no loop
+    offsets, pred = graph.predecessors()
+    stack = [x for x in dfs_postorder(graph) if x is not None]
+    removed = bytearray(graph.numBlocks())
+    cycles = defaultdict(set)
 
-    removed = set()
+    while stack:
+        x = stack.pop()
 
-    def _find_cycle(start):
         cycle = set()
-        queue = set([start])
+        queue = set([x])
         while queue:
-            x = queue.pop()
-            for p in graph.parents(x):
-                if p not in removed and p not in cycle:
+            y = queue.pop()
+            for i in xrange(offsets[y], offsets[y+1]):
+                p = pred[i]
+                if not removed[p] and p not in cycle:
                     cycle.add(p)
                     queue.add(p)
-        return cycle
 
-    cycles = defaultdict(set)
-
-    while stack:
-        x = stack.pop()
-        cycle = _find_cycle(x)
-        for c in cycle:
-            cycles[c].add(tuple(cycle))
-        removed.add(x)
+        if cycle:
+            cycle = Cycle(cycle)
+            for c in cycle:
+                cycles[c].add(cycle)
+        removed[x] = 1
 
     return cycles
 
@@ -139,24 +199,26 @@ def find_cycle_exits(graph, cycle):
     return out
 
 class FlowAnalysis(object):
-    def __init__(self, addr, graph):
+    def __init__(self, addr, graph, propagate_constants=False):
         self.addr = addr
         self.graph = graph
+        # hand the labels the constants found by ssa.ConstantPropagation, more precise but slower
+        self.propagate_constants = propagate_constants
         self.cycles = find_cycles(self.graph)
         self.merges = find_merge_points(self.graph)
         self.labels = dict()
         self._visited = set()
+        self._used_cycles = set()
 
     def get_unused_cycle(self, x):
         for cycle in self.cycles[x]:
-            unused = True
-            for y in cycle:
-                if y in self._visited:
-                    unused = False
-                    break
-            if unused:
-                self.cycles[x].remove(cycle)
-                return cycle
+            if cycle in self._used_cycles:
+                continue
+            if any(y in self._visited for y in cycle):
+                self._used_cycles.add(cycle)
+                continue
+            self.cycles[x].remove(cycle)
+            return cycle
 
     def _process_cascades(self, entry_points, after, break_target, continue_target):
         next_after = after
@@ -231,7 +293,7 @@ class FlowAnalysis(object):
             childs = self.graph.childs(x)
 
             if (len(self.graph.parents(x)) > 1 or need_label) and x not in self.labels:
-                self.labels[x] = flowcontrol.Label(self.graph.block_starts[x])
+                self.labels[x] = flowcontrol.Label(self.graph.blockAddress(x))
                 out.append(self.labels[x])
                 need_label = False
 
@@ -297,7 +359,7 @@ class FlowAnalysis(object):
                 postcond = last.cond.negated()
                 inner = flowcontrol.Block(inner.contents[:-1])
                 last.option_a.contents[0].target_label.breaks.remove(last.option_a.contents[0]) # TODO: XXX: ugly!
-                return flowcontrol.DoWhile(inner, postcond, continue_label)
+                return flowcontrol.DoWhile(inner, postcond, continue_label, last.split)
         return flowcontrol.While(inner, continue_label)
 
     def analyze(self):
@@ -317,17 +379,32 @@ class FlowAnalysis(object):
             ctx.setValue('ROMBANK', Constant(self.addr.bank()))
 
         content = self.process(self.graph.start(), None, False, False, True)
+
+        if self.propagate_constants and self.labels:
+            constants = ConstantPropagation(self.graph, ctx)
+            for x, label in self.labels.items():
+                if x is not None:
+                    label.setConstants(constants.constantsAt(x))
+
         content = content.optimizedWithContext(ctx)
-        content = content.optimizeDependencies(set(ALL_REGS) - set(['FZ', 'FN', 'FC', 'FH']))
-        return content
+        liveness = Liveness(self.graph, content, self.labels, ALL_REGS_MASK & ~FLAGS_MASK)
+        return content.withoutDead(liveness.dead)
 
 class ProcedureFlow(object):
-    def __init__(self, proj, addr):
+    def __init__(self, proj, addr, graph=None):
         self.addr = addr
 
-        graph = procedure.loadProcedureGraph(proj, addr)
+        if graph is None:
+            graph = procedure.loadProcedureGraph(proj, addr)
 
-        analysis = FlowAnalysis(addr, graph)
+        # dependency sets of the callees this flow was analysed with, both as decoded and as resolved by the analysis
+        self.callee_deps = dict()
+        for block in graph.blocks:
+            for instr in (block.contents if block else ()):
+                if hasattr(instr, 'target_depset'):
+                    self.callee_deps[instr.targetAddr] = encodeDependencySet(instr.target_depset)
+
+        analysis = FlowAnalysis(addr, graph, proj.config.get(['Flow-Constant-Propagation']))
         self.content = analysis.analyze()
 
         self.deps = self.content.getDependencySet()
@@ -341,12 +418,16 @@ class ProcedureFlow(object):
         self.has_nop = False
         self.has_ambig_calls = False
         self.length = graph.getProcLength()
+        self.owned_runs = graph.owned_runs
 
         self.memreads = set()
         self.memwrites = set()
 
         for instr in self.getInstructions():
 
+            if hasattr(instr, 'target_depset'):
+                self.callee_deps[instr.targetAddr] = encodeDependencySet(instr.target_depset)
+
             if instr.name == 'CALL':
                 self._calls |= instr.calls()
             elif instr.name == 'tail-call':
@@ -372,7 +453,7 @@ class ProcedureFlow(object):
             #        self._computedJumps = True
 
     def getDependencySet(self):
-        return DependencySet(self.deps.reads - set(['FZ', 'FN', 'FC', 'FH']), self.deps.writes)
+        return DependencySet(self.deps.reads & ~FLAGS_MASK, self.deps.writes, self.deps.addresses)
 
     def getInstructions(self):
         out = set()
@@ -392,6 +473,33 @@ class ProcedureFlow(object):
         for x in self.getInstructions():
             x.addToIndex(index)
 
+class ProcSummary(object):
+    """The results of a ProcedureFlow that update_info saves, without the flow itself. Small enough to pass between processes."""
+
+    def __init__(self, proc):
+        self.addr = proc.addr
+        self.depset = proc.getDependencySet()
+        self.has_switch = proc.has_switch
+        self.suspicious_switch = proc.suspicious_switch
+        self.has_suspicious_instr = proc.has_suspicious_instr
+        self.has_nop = proc.has_nop
+        self.has_ambig_calls = proc.has_ambig_calls
+        self.length = proc.length
+        self.owned_runs = proc.owned_runs
+        self.memreads = proc.memreads
+        self.memwrites = proc.memwrites
+        self._calls = proc.calls()
+        self._tail_calls = proc.tailCalls()
+
+    def getDependencySet(self):
+        return self.depset
+
+    def calls(self):
+        return self._calls
+
+    def tailCalls(self):
+        return self._tail_calls
+
 def update_info(proc, database):
     print 'Updating info for', str(proc.addr)
     info = database.procInfo(proc.addr)
@@ -407,23 +515,95 @@ def update_info(proc, database):
     info.tail_calls = proc.tailCalls()
     info.memreads = proc.memreads
     info.memwrites = proc.memwrites
-    info.save(database.connection)
+    database.setOwnership(proc.addr, proc.owned_runs)
+    database.saveProcInfo(info)
 
 class ProcedureFlowCache(object):
+    """
+    LRU cache of ProcedureFlow objects, bounded by the total number of instructions they hold.
+
+    Cached procs that used the dependency set of a callee are dropped when that set changes.
+    """
+
     def __init__(self, proj):
         self.proj = proj
-        self.cache = dict()
+        self.cache = OrderedDict()
+        self.sizes = dict()
+        self.size = 0
+        self.max_size = proj.config.get(['Flow-Cache-Size'])
+        self.dependents = defaultdict(set)
+        if proj.config.get(['Flow-Disk-Cache']):
+            tag = 'constants' if proj.config.get(['Flow-Constant-Propagation']) else None
+            self.store = FlowStore(proj, proj.filenameBase() + '.flowcache', tag)
+        else:
+            self.store = None
+
+    def analyze(self, addr):
+        """Flow of the proc at addr, taken from the disk store while its entry is still valid."""
+        if not self.store:
+            return ProcedureFlow(self.proj, addr)
+
+        r = procedure.loadProcedureRange(self.proj, addr)
+        proc = self.store.load(addr, r.owned_bytes.runs())
+        if proc is None:
+            proc = ProcedureFlow(self.proj, addr, procedure.graphFromRange(self.proj, r))
+            self.store.save(proc)
+        return proc
 
     def uncached(self, addr):
-        return ProcedureFlow(self.proj, addr)
+        return self.analyze(addr)
 
     def refresh(self, addr):
-        self.cache[addr] = None
-        self.cache[addr] = ProcedureFlow(self.proj, addr)
-        update_info(self.cache[addr], self.proj.database)
+        self.drop(addr)
+        return self.build(addr)
 
     def at(self, addr):
-        if addr not in self.cache:
-            self.cache[addr] = ProcedureFlow(self.proj, addr)
-            update_info(self.cache[addr], self.proj.database)
-        return self.cache[addr]
+        if addr in self.cache:
+            proc = self.cache.pop(addr)
+            self.cache[addr] = proc
+            return proc
+        return self.build(addr)
+
+    def build(self, addr):
+        proc = self.analyze(addr)
+        self.save(proc)
+        self.insert(addr, proc)
+        return proc
+
+    def save(self, proc):
+        """Write the results of proc (a ProcedureFlow or ProcSummary) and drop what used the old dependency set."""
+        database = self.proj.database
+        old_deps = encodeDependencySet(database.procInfo(proc.addr).depset)
+        update_info(proc, database)
+        if encodeDependencySet(proc.getDependencySet()) != old_deps:
+            self.invalidateCallers(proc.addr)
+
+    def insert(self, addr, proc):
+        instructions = proc.getInstructions()
+        for callee in proc.callee_deps:
+            self.dependents[callee].add(addr)
+
+        self.cache[addr] = proc
+        self.sizes[addr] = len(instructions)
+        self.size += self.sizes[addr]
+
+        while self.size > self.max_size and len(self.cache) > 1:
+            oldest = next(iter(self.cache))
+            self.drop(oldest)
+
+    def drop(self, addr):
+        if addr in self.cache:
+            proc = self.cache.pop(addr)
+            self.size -= self.sizes.pop(addr)
+            for callee in proc.callee_deps:
+                callers = self.dependents.get(callee)
+                if callers is not None:
+                    callers.discard(addr)
+                    if not callers:
+                        del self.dependents[callee]
+
+    def invalidateCallers(self, addr):
+        self.proj.disasm.invalidateCallsTo(addr)
+        for caller in self.dependents.pop(addr, ()):
+            if caller != addr:
+                self.drop(caller)
@@ -16,10 +16,10 @@
 
 from awake import address, placeholders
 from awake.context import Context
-from awake.depend import DependencySet, dependParallel, joinDependencies, unknownDependencySet
+from awake.depend import DependencySet, dependencySetFromNames, dependParallel, joinDependencies, unknownDependencySet
 from awake.instruction import BaseOp, Instruction
 from awake.operand import AddressConstant, Constant, JumpTableAddress, LabelAddress
-from awake.regutil import ALL_REGS, joinRegisters
+from awake.regutil import ALL_REGS_MASK, FLAGS_MASK, MEM_MASK, joinRegisters, maskNames
 
 class Label(BaseOp):
     def __init__(self, addr):
@@ -28,8 +28,9 @@ class Label(BaseOp):
         self.gotos = set()
         self.breaks = set()
         self.continues = set()
-        self.needed = ALL_REGS - set(['FZ', 'FC', 'FN', 'FH'])
+        self.needed = ALL_REGS_MASK & ~FLAGS_MASK
         self.depset = unknownDependencySet()
+        self.constants = dict()
 
     def addGoto(self, x):
         self.gotos.add(x)
@@ -42,10 +43,16 @@ class Label(BaseOp):
 
     def optimizedWithContext(self, ctx):
         if self.gotos or self.breaks or self.continues:
-            for w in self.depset.writes:
+            for w in maskNames(self.depset.writes):
                 ctx.setValueComplex(w)
+        for register, value in self.constants.items():
+            ctx.setValue(register, value)
         return self
 
+    def setConstants(self, constants):
+        """Register values known on every path to the label, see ssa.ConstantPropagation."""
+        self.constants = constants
+
     def setContextWrites(self, writes):
         self.depset.writes = writes
 
@@ -57,15 +64,15 @@ class Label(BaseOp):
 
     def optimizeDependencies(self, needed):
         if self.gotos or self.breaks or self.continues:
-            self.needed = set(needed)
+            self.needed = needed
             self.depset.reads = needed
             return self
         else:
             return None
 
     def signature(self):
-        ins = joinRegisters(self.needed & ALL_REGS)
-        return ' @ ' + ', '.join(sorted(str(x) for x in ins if not isinstance(x, address.Address)))
+        ins = joinRegisters(maskNames(self.needed & ALL_REGS_MASK))
+        return ' @ ' + ', '.join(sorted(ins))
 
     def render(self, renderer, labels=None):
         if not self.gotos:
@@ -97,11 +104,11 @@ class Goto(FlowTerminator):
         return self.target_label.needed
 
     def getDependencySet(self):
-        return DependencySet(self.target_label.depset.reads, set())
+        return DependencySet(self.target_label.depset.reads)
 
     def signature(self):
-        ins = joinRegisters(self.target_label.needed & ALL_REGS)
-        return ' @ ' + ', '.join(sorted(str(x) for x in ins if not isinstance(x, address.Address)))
+        ins = joinRegisters(maskNames(self.target_label.needed & ALL_REGS_MASK))
+        return ' @ ' + ', '.join(sorted(ins))
 
 class Break(FlowTerminator):
     def __init__(self, label):
@@ -113,11 +120,11 @@ class Break(FlowTerminator):
         return self.target_label.needed
 
     def getDependencySet(self):
-        return DependencySet(self.target_label.depset.reads, set())
+        return DependencySet(self.target_label.depset.reads)
 
     def signature(self):
-        ins = joinRegisters(self.target_label.needed & ALL_REGS)
-        return ' @ ' + ', '.join(sorted(str(x) for x in ins if not isinstance(x, address.Address)))
+        ins = joinRegisters(maskNames(self.target_label.needed & ALL_REGS_MASK))
+        return ' @ ' + ', '.join(sorted(ins))
 
 class Continue(FlowTerminator):
     def __init__(self, label):
@@ -131,11 +138,11 @@ class Continue(FlowTerminator):
     def getDependencySet(self):
         #return self.target_label.depset
         #TODO: XXX: return depend.DependencySet(self.target_label.depset.reads, regutil.ALL_REGS)
-        return DependencySet(self.target_label.depset.reads, set())
+        return DependencySet(self.target_label.depset.reads)
 
     def signature(self):
-        ins = joinRegisters(self.target_label.needed & ALL_REGS)
-        return ' @ ' + ', '.join(sorted(str(x) for x in ins if not isinstance(x, address.Address)))
+        ins = joinRegisters(maskNames(self.target_label.needed & ALL_REGS_MASK))
+        return ' @ ' + ', '.join(sorted(ins))
 
 class Return(FlowTerminator):
     def __init__(self):
@@ -148,11 +155,20 @@ class Return(FlowTerminator):
         return needed
 
 class Block(Instruction):
+    """
+    Sequence of instructions. Instructions are split to simple ones once, when the procedure
+    graph is built (see split), and passes return unchanged nodes as they are.
+    """
+
     def __init__(self, contents):
-        self.contents = []
-        for x in contents:
-            self.contents += x.splitToSimple()
-        #self.contents = contents
+        self.contents = contents
+
+    @classmethod
+    def split(cls, instructions):
+        contents = []
+        for x in instructions:
+            contents += x.splitToSimple()
+        return cls(contents)
 
     def __bool__(self):
         return bool(self.contents)
@@ -182,10 +198,13 @@ class Block(Instruction):
         return 'block'+str(len(self.contents))+':'+str(bool(self))+'(' + ','.join(sorted(str(el) for el in self.contents)) + ')'
 
     def optimizedWithContext(self, context):
-        contents = []
-        for instr in self.contents:
-            instr = instr.optimizedWithContext(context)
-            contents.append(instr)
+        contents = [instr.optimizedWithContext(context) for instr in self.contents]
+        return self.withContents(contents)
+
+    def withContents(self, contents):
+        """Block of contents, or self if they are the same instructions."""
+        if len(contents) == len(self.contents) and all(a is b for a, b in zip(contents, self.contents)):
+            return self
         return Block(contents)
 
     def getDependencies(self, needed):
@@ -199,15 +218,13 @@ class Block(Instruction):
             cur = joinDependencies(instr.getDependencySet(), cur)
         return cur
 
-    def optimizeDependencies(self, needed):
+    def withoutDead(self, dead):
         contents = []
-        for instr in reversed(self.contents):
-            instr = instr.optimizeDependencies(needed)
+        for instr in self.contents:
+            instr = instr.withoutDead(dead)
             if instr:
-                needed = instr.getDependencies(needed)
                 contents.append(instr)
-        contents.reverse()
-        return Block(contents)
+        return self.withContents(contents)
 
     def getInstructions(self, out):
         for x in self.contents:
@@ -269,12 +286,12 @@ class Switch(Instruction):
 
         branches = [b.optimizedWithContext(ctx.clone()) for b in self.branches]
         for b in self.branches:
-            for w in b.getDependencySet().writes:
+            for w in maskNames(b.getDependencySet().writes):
                 ctx.setValueComplex(w)
-        return Switch(self.addr, branches, arg, base_value)
+        return self.withBranches(branches, arg, base_value)
 
     def getDependencies(self, needed):
-        deps = self.arg.getDependencies()
+        deps = self.arg.getDependencyMask()
         for b in self.branches:
             deps |= b.getDependencies(needed)
         return deps
@@ -283,11 +300,16 @@ class Switch(Instruction):
         deps = DependencySet()
         for b in self.branches:
             deps = dependParallel(b.getDependencySet(), deps)
-        return DependencySet(deps.reads | self.arg.getDependencies(), deps.writes)
+        return dependParallel(deps, dependencySetFromNames(self.arg.getDependencies()))
 
-    def optimizeDependencies(self, needed):
-        branches = [b.optimizeDependencies(needed) for b in self.branches]
-        return Switch(self.addr, branches, self.arg, self.base_value)
+    def withoutDead(self, dead):
+        branches = [b.withoutDead(dead) for b in self.branches]
+        return self.withBranches(branches, self.arg, self.base_value)
+
+    def withBranches(self, branches, arg, base_value):
+        if arg is self.arg and base_value == self.base_value and all(a is b for a, b in zip(branches, self.branches)):
+            return self
+        return Switch(self.addr, branches, arg, base_value)
 
 
 class If(Instruction):
@@ -354,16 +376,16 @@ class If(Instruction):
             option_b = self.option_b.optimizedWithContext(ctx.clone())
 
         if self.option_a:
-            for w in self.option_a.getDependencySet().writes:
+            for w in maskNames(self.option_a.getDependencySet().writes):
                 ctx.setValueComplex(w)
         if self.option_b:
-            for w in self.option_b.getDependencySet().writes:
+            for w in maskNames(self.option_b.getDependencySet().writes):
                 ctx.setValueComplex(w)
 
-        return If(self.split, cond, option_a, option_b)
+        return self.withOptions(cond, option_a, option_b)
 
     def getDependencies(self, needed):
-        deps = set()
+        deps = 0
         if self.option_a:
             deps |= self.option_a.getDependencies(needed)
         else:
@@ -372,7 +394,7 @@ class If(Instruction):
             deps |= self.option_b.getDependencies(needed)
         else:
             deps |= needed
-        deps |= self.cond.getDependencies()
+        deps |= self.cond.getDependencyMask()
         return deps
 
     def getDependencySet(self):
@@ -381,17 +403,22 @@ class If(Instruction):
             deps = dependParallel(self.option_a.getDependencySet(), deps)
         if self.option_b:
             deps = dependParallel(self.option_b.getDependencySet(), deps)
-        cond_deps = DependencySet(self.cond.getDependencies())
+        cond_deps = dependencySetFromNames(self.cond.getDependencies())
         return joinDependencies(cond_deps, deps)
 
-    def optimizeDependencies(self, needed):
+    def withoutDead(self, dead):
         option_a = None
         if self.option_a:
-            option_a = self.option_a.optimizeDependencies(needed)
+            option_a = self.option_a.withoutDead(dead)
         option_b = None
         if self.option_b:
-            option_b = self.option_b.optimizeDependencies(needed)
-        return If(self.split, self.cond, option_a, option_b)
+            option_b = self.option_b.withoutDead(dead)
+        return self.withOptions(self.cond, option_a, option_b)
+
+    def withOptions(self, cond, option_a, option_b):
+        if cond is self.cond and option_a is self.option_a and option_b is self.option_b:
+            return self
+        return If(self.split, cond, option_a, option_b)
 
     def getInstructions(self, out):
         if self.option_a:
@@ -413,9 +440,10 @@ class LoopWhile(Instruction):
         out.add(self)
 
 class DoWhile(LoopWhile):
-    def __init__(self, inner, postcond, continue_label):
+    def __init__(self, inner, postcond, continue_label, split):
         self.name = 'do-while'
         self.addr = address.fromVirtual(0)
+        self.split = split  # address of the conditional jump back
         self.inner = inner
         self.postcond = postcond
         self.continue_label = continue_label
@@ -444,10 +472,10 @@ class DoWhile(LoopWhile):
 
         inner = self.inner.optimizedWithContext(ctx2)
         postcond = self.postcond.optimizedWithContext(ctx2)
-        return DoWhile(inner, postcond, self.continue_label)
+        return self.withInner(inner, postcond)
 
     def getDependencies(self, needed):
-        pass1 = self.inner.getDependencies(needed | self.postcond.getDependencies())
+        pass1 = self.inner.getDependencies(needed | self.postcond.getDependencyMask())
         pass2 = self.inner.getDependencies(pass1)
 
         pass3 = self.inner.getDependencies(pass2)
@@ -457,21 +485,22 @@ class DoWhile(LoopWhile):
 
     def getDependencySet(self):
         x = self.inner.getDependencySet()
-        postcond_deps = DependencySet(self.postcond.getDependencies())
+        postcond_deps = dependencySetFromNames(self.postcond.getDependencies())
         return joinDependencies(x, postcond_deps)
 
-    def optimizeDependencies(self, needed):
-        if self.continue_label:
-            self.continue_label.optimizeDependencies(self.getDependencies(needed))
-        inner = self.inner.optimizeDependencies(needed | self.postcond.getDependencies() | self.getDependencies(needed))
-        return DoWhile(inner, self.postcond, self.continue_label)
+    def withoutDead(self, dead):
+        return self.withInner(self.inner.withoutDead(dead), self.postcond)
+
+    def withInner(self, inner, postcond):
+        if inner is self.inner and postcond is self.postcond:
+            return self
+        return DoWhile(inner, postcond, self.continue_label, self.split)
 
     def signature(self):
         deps = self.inner.getDependencySet()
-        loopvars = deps.writes & (deps.reads | self.postcond.getDependencies())
-        loopvars -= set(['mem'])
-        loopvars = joinRegisters(loopvars)
-        return " @ loopvars: " + ", ".join(sorted(str(x) for x in loopvars if not isinstance(x, address.Address)))
+        loopvars = deps.writes & (deps.reads | self.postcond.getDependencyMask()) & ~MEM_MASK
+        loopvars = joinRegisters(maskNames(loopvars))
+        return " @ loopvars: " + ", ".join(sorted(loopvars))
 
     def getMemreads(self):
         return self.postcond.getMemreads()
@@ -500,8 +529,7 @@ class While(LoopWhile):
 
     def optimizedWithContext(self, ctx):
         ctx.invalidateAll()
-        inner = self.inner.optimizedWithContext(Context())
-        return While(inner, self.continue_label)
+        return self.withInner(self.inner.optimizedWithContext(Context()))
 
     def getDependencies(self, needed):
         pass1 = self.inner.getDependencies(needed)
@@ -515,16 +543,17 @@ class While(LoopWhile):
     def getDependencySet(self):
         return self.inner.getDependencySet()
 
-    def optimizeDependencies(self, needed):
-        if self.continue_label:
-            self.continue_label.optimizeDependencies(self.getDependencies(needed))
-        inner = self.inner.optimizeDependencies(needed | self.getDependencies(needed))
+    def withoutDead(self, dead):
+        return self.withInner(self.inner.withoutDead(dead))
+
+    def withInner(self, inner):
+        if inner is self.inner:
+            return self
         return While(inner, self.continue_label)
 
     def signature(self):
         deps = self.inner.getDependencySet()
-        loopvars = deps.writes & deps.reads
-        loopvars -= set(['mem'])
-        loopvars = joinRegisters(loopvars)
-        return " @ loopvars: " + ", ".join(sorted(str(x) for x in loopvars if not isinstance(x, address.Address)))
+        loopvars = deps.writes & deps.reads & ~MEM_MASK
+        loopvars = joinRegisters(maskNames(loopvars))
+        return " @ loopvars: " + ", ".join(sorted(loopvars))
 
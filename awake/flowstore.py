@@ -0,0 +1,125 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import cPickle as pickle
+import errno
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+from awake.depend import encodeDependencySet
+
+_code_version = None
+
+def codeVersion():
+    """
+    Digest of the awake sources. Flows pickled by different code may differ in shape or
+    meaning, so each version of the code keeps its own entries.
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha1()
+        package = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(package)):
+            if name.endswith('.py') and not name.startswith('test_'):
+                with open(os.path.join(package, name), 'rb') as f:
+                    digest.update(name)
+                    digest.update(f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+class FlowStore(object):
+    """
+    On-disk cache of analysed ProcedureFlow objects.
+
+    Entries live in a directory named after the ROM hash and the code version and are keyed
+    by proc address and the bytes the proc owns. Each entry carries the callee dependency sets it was analysed with
+    and is only used while the database still agrees with them. A tag names the analysis
+    settings the flows depend on, flows made with other settings go to another directory.
+    Directories left by other code versions for the same ROM and older entries of a saved proc
+    are deleted.
+    """
+
+    def __init__(self, proj, path, tag=None):
+        self.proj = proj
+        name = '{0}-{1}'.format(proj.rom.hash(), codeVersion())
+        if tag:
+            name += '-' + tag
+        self.path = os.path.join(path, name)
+        self.prune(path)
+
+    def prune(self, path):
+        """Delete the directories of this ROM written by other code versions, they are never read again."""
+        try:
+            names = os.listdir(path)
+        except EnvironmentError:
+            return
+        rom_hash = self.proj.rom.hash()
+        for name in names:
+            parts = name.split('-')
+            if len(parts) >= 2 and parts[0] == rom_hash and parts[1] != codeVersion():
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    def filename(self, addr, runs):
+        digest = hashlib.sha1(repr(runs)).hexdigest()[:16]
+        return os.path.join(self.path, '{0:06X}-{1}.flow'.format(addr.address, digest))
+
+    def load(self, addr, runs):
+        try:
+            with open(self.filename(addr, runs), 'rb') as f:
+                proc = pickle.load(f)
+        except Exception:  # missing, stale or damaged entries are all misses
+            return None
+
+        database = self.proj.database
+        for callee, deps in proc.callee_deps.items():
+            if encodeDependencySet(database.procInfo(callee).depset) != deps:
+                return None
+        return proc
+
+    def save(self, proc):
+        """Write proc to the store. The store is only a cache, flows that cannot be written stay in memory only."""
+        try:
+            if not os.path.isdir(self.path):
+                try:
+                    os.makedirs(self.path)
+                except OSError as e:  # worker processes create it concurrently
+                    if e.errno != errno.EEXIST:
+                        raise
+            fd, temp = tempfile.mkstemp(dir=self.path)
+        except EnvironmentError:
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(proc, f, pickle.HIGHEST_PROTOCOL)
+            filename = self.filename(proc.addr, proc.owned_runs)
+            os.rename(temp, filename)
+        except (EnvironmentError, pickle.PicklingError, TypeError, RuntimeError):  # RuntimeError: too deeply nested
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            return
+
+        # entries for the runs the proc owned before are never read again
+        for old in glob.glob(os.path.join(self.path, '{0:06X}-*.flow'.format(proc.addr.address))):
+            if old != filename:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
@@ -19,9 +19,12 @@ from awake.depend import DependencySet, unknownDependencySet
 from awake.expression import parse
 from awake.jumptable import JumpTable
 from awake.operand import ComplexValue, ComputedProcAddress, JumpTableAddress, ProcAddress
-from awake.regutil import ALL_REGS, joinRegisters, splitRegister, splitRegisters
+from awake.regutil import ALL_REGS_MASK, MEM_MASK, isRegister, joinRegisters, maskNames, registerMask
+
+SIDEEFFECTS_MASK = registerMask(['sideeffects'])
 
 class Instruction(object):
+    __slots__ = ('name', 'addr')
     def __init__(self, name, addr=None):
         self.name = name
         self.addr = addr
@@ -54,8 +57,12 @@ class Instruction(object):
         ctx.invalidateAll()
         return self
 
+    def updateContext(self, ctx):
+        """Apply the effect of the instruction to ctx, leaving the instruction itself unchanged."""
+        self.optimizedWithContext(ctx)
+
     def getDependencies(self, needed):
-        return needed | ALL_REGS
+        return needed | ALL_REGS_MASK
 
     def getDependencySet(self):
         return unknownDependencySet()
@@ -63,6 +70,12 @@ class Instruction(object):
     def optimizeDependencies(self, needed):
         return self
 
+    def withoutDead(self, dead):
+        """Copy of the flow without the instructions in dead, see liveness.Liveness."""
+        if self in dead:
+            return None
+        return self
+
     def splitToSimple(self):
         return [self]
 
@@ -84,6 +97,7 @@ class Instruction(object):
 
 
 class BaseOp(Instruction):
+    __slots__ = ('_operands',)
     def __init__(self, name, operands, addr=None):
         super(BaseOp, self).__init__(name, addr)
         self._operands = operands
@@ -93,15 +107,17 @@ class BaseOp(Instruction):
 
 
 class ExpressionOp(BaseOp):
+    __slots__ = ('_reads', '_writes', '_addresses', '_values', '_loads')
     def __init__(self, name, operands, addr, reads, writes, values, loads):
         super(ExpressionOp, self).__init__(name, operands, addr)
         self._reads = reads
         self._writes = writes
+        self._addresses = frozenset()
         self._values = values
         self._loads = loads
 
     def optimizedWithContext(self, ctx):
-        for w in self._writes:
+        for w in maskNames(self._writes):
             if w not in self._values:
                 ctx.setValue(w, ComplexValue(self.name))
             else:
@@ -112,29 +128,29 @@ class ExpressionOp(BaseOp):
         return self
 
     def getDependencies(self, needed):
-        return (needed - self._writes) | self._reads
+        return (needed & ~self._writes) | self._reads
 
     def getDependencySet(self):
-        return DependencySet(self._reads, self._writes)
+        return DependencySet(self._reads, self._writes, self._addresses)
 
     def splitToSimple(self):
 
-        if 'sideeffects' in self._writes:
+        if self._writes & SIDEEFFECTS_MASK:
             return [self]
 
-        writes = set(self._writes) - set(['mem'])
+        writes = self._writes & ~MEM_MASK
 
         out = []
         for w in self._loads:
             name = w[0]
             value = w[1]
             target = parse(name)
-            writes -= splitRegisters(target.getDependencies())
+            writes &= ~registerMask(target.getDependencies())
             instr = LoadInstruction('LD_'+self.name, target, value, self.addr)
             out.append(instr)
 
-        for w in writes:
-            value = ComplexValue(self.name, self.getDependencySet().reads)
+        for w in maskNames(writes):
+            value = ComplexValue(self.name, self.getDependencySet().readNames())
             target = parse(w)
             instr = LoadInstruction('LD_'+self.name, target, value, self.addr)
             out.append(instr)
@@ -142,7 +158,7 @@ class ExpressionOp(BaseOp):
         return out
 
     def optimizeDependencies(self, needed):
-        if not (self._writes & needed) and 'sideeffects' not in self._writes and 'mem' not in self._writes:
+        if not (self._writes & (needed | SIDEEFFECTS_MASK | MEM_MASK)):
             return None
         return self
 
@@ -161,6 +177,7 @@ class ExpressionOp(BaseOp):
         return out
 
 class BadOpcode(Instruction):
+    __slots__ = ()
     def __init__(self, opcodes, addr):
         super(BadOpcode, self).__init__("BAD-OP", addr)
 
@@ -168,6 +185,7 @@ class BadOpcode(Instruction):
         return False
 
 class JumpInstruction(Instruction):
+    __slots__ = ('_reads', '_writes', 'cond', 'target', 'targetAddr')
     def __init__(self, name, target, cond, addr, reads, writes):
         super(JumpInstruction, self).__init__(name, addr)
 
@@ -190,7 +208,7 @@ class JumpInstruction(Instruction):
         return JumpInstruction(self.name, self.target.optimizedWithContext(ctx), self.cond, self.addr, self._reads, self._writes)
 
     def getDependencies(self, needed):
-        return (needed - self._writes) | self._reads
+        return (needed & ~self._writes) | self._reads
 
     def getDependencySet(self):
         return DependencySet(self._reads, self._writes)
@@ -221,6 +239,7 @@ class JumpInstruction(Instruction):
 
 
 class CallInstruction(Instruction):
+    __slots__ = ('cond', 'target', 'targetAddr', 'target_depset', 'returns_used', 'constant_params')
     def __init__(self, proj, name, target, cond, addr):
         super(CallInstruction, self).__init__(name, addr)
 
@@ -249,20 +268,19 @@ class CallInstruction(Instruction):
 
         self.target_depset = proj.database.procInfo(self.targetAddr).depset
 
-        self.returns_used = ALL_REGS
+        self.returns_used = ALL_REGS_MASK
         self.constant_params = dict()
 
     def getDependencies(self, needed):
         #return flow.getProcDeps(self.targetAddr, needed)
         deps = self.getDependencySet()
-        return (needed - deps.writes) | deps.reads
+        return (needed & ~deps.writes) | deps.reads
 
     def getDependencySet(self):
-        reads = set(self.target_depset.reads)
-        for r in joinRegisters(reads):
-            if r in self.constant_params:
-                reads -= splitRegister(r)
-        return DependencySet(reads, self.target_depset.writes)
+        reads = self.target_depset.reads
+        for r in self.constant_params:
+            reads &= ~registerMask([r])
+        return DependencySet(reads, self.target_depset.writes, self.target_depset.addresses)
 
     def optimizeDependencies(self, needed):
         self.returns_used = needed & self.getDependencySet().writes
@@ -281,21 +299,26 @@ class CallInstruction(Instruction):
 
         deps = self.getDependencySet()
 
-        ins = joinRegisters(deps.reads - set(['mem']))
+        ins = joinRegisters(maskNames(deps.reads & ~MEM_MASK))
 
         for param in ins:
             if ctx.hasConstantValue(param):
                 self.constant_params[param] = ctx.getValue(param)
 
-        for w in deps.writes:
-            ctx.setValueComplex(w)
+        self.updateContext(ctx)
+        return self
 
+    def updateContext(self, ctx):
         # TODO: XXX
-        if self.targetAddr.virtual() == 0x07B9:
-            if 'A' in self.constant_params:
-                ctx.setValue('ROMBANK', self.constant_params['A'])
+        bank = None
+        if self.targetAddr.virtual() == 0x07B9 and ctx.hasConstantValue('A'):
+            bank = ctx.getValue('A')
 
-        return self
+        for w in maskNames(self.getDependencySet().writes):
+            ctx.setValueComplex(w)
+
+        if bank is not None:
+            ctx.setValue('ROMBANK', bank)
 
     def calls(self):
         if self.targetAddr.inPhysicalMem() and not self.targetAddr.isAmbiguous():
@@ -321,8 +344,8 @@ class CallInstruction(Instruction):
             x = 'CONDITIONAL'
 
         depset = self.getDependencySet().onlyRegisters()
-        ins = joinRegisters(depset.reads - set(['mem']))
-        outs = joinRegisters(self.returns_used - set(['mem']))
+        ins = joinRegisters(maskNames(depset.reads & ~MEM_MASK))
+        outs = joinRegisters(maskNames(self.returns_used & ~MEM_MASK))
 
         ins |= set(param+'='+str(self.constant_params[param]) for param in self.constant_params)
 
@@ -336,11 +359,13 @@ class CallInstruction(Instruction):
 
 
 class TailCall(CallInstruction):
+    __slots__ = ()
     def __init__(self, proj, target):
         super(TailCall, self).__init__(proj, 'tail-call', target, placeholders.ALWAYS, target.getAddress())
 
 
 class SwitchInstruction(BaseOp):
+    __slots__ = ('jt',)
     def __init__(self, proj, addr):
         super(SwitchInstruction, self).__init__('switch', [placeholders.A, JumpTableAddress(addr.offset(1))], addr)
         self.jt = JumpTable(proj, addr.offset(1))
@@ -413,6 +438,7 @@ class SwitchInstruction(BaseOp):
 
 
 class RetInstruction(Instruction):
+    __slots__ = ('cond',)
     def __init__(self, name, cond, addr):
         super(RetInstruction, self).__init__(name, addr)
         self.cond = cond
@@ -430,17 +456,19 @@ class RetInstruction(Instruction):
             return []
 
 class LoadInstruction(ExpressionOp):
+    __slots__ = ('target', 'source')
     def __init__(self, name, target, source, addr=None):
 
         reads = source.getDependencies()
-        writes = set()
+        writes = 0
         if hasattr(target, 'target'):
             reads |= target.getDependencies()
-            writes.add('mem')
+            writes = MEM_MASK
         else:
-            writes |= target.getDependencies()
+            writes = registerMask(target.getDependencies())
 
-        super(LoadInstruction, self).__init__(name, [target, source], addr, reads, writes, dict(), [])
+        super(LoadInstruction, self).__init__(name, [target, source], addr, registerMask(reads), writes, None, ())
+        self._addresses = frozenset(x for x in reads if not isRegister(x))
         self.target = target
         self.source = source
 
@@ -448,6 +476,15 @@ class LoadInstruction(ExpressionOp):
         return [self]
 
     def optimizedWithContext(self, ctx):
+        target, source = self.optimizedOperands(ctx)
+        if target is self.target and source is self.source:
+            return self
+        return LoadInstruction(self.name, target, source, self.addr)
+
+    def updateContext(self, ctx):
+        self.optimizedOperands(ctx)
+
+    def optimizedOperands(self, ctx):
         source = self.source.optimizedWithContext(ctx)
         target = self.target
 
@@ -468,7 +505,7 @@ class LoadInstruction(ExpressionOp):
             # Register target
             ctx.setValue(target.name, source)
 
-        return LoadInstruction(self.name, target, source, self.addr)
+        return target, source
 
     def render(self, renderer):
         renderer.newInstruction(self.addr)
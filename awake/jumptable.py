@@ -24,9 +24,7 @@ class JumpTable(object):
 
         for i in range(256):
             a = addr.offset(i*2)
-            lo = proj.rom.get(a)
-            hi = proj.rom.get(a.offset(1))
-            value = address.fromVirtualAndCurrent((hi<<8) | lo, addr)
+            value = address.fromVirtualAndCurrent(proj.rom.get_word(a), addr)
 
             if not value.inPhysicalMem():
                 break
@@ -0,0 +1,166 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from awake import flowcontrol
+from awake.regutil import REG_NAMES
+
+# every bit a dependency mask can have
+FULL_MASK = (1 << len(REG_NAMES)) - 1
+
+def genKill(instr):
+    """Masks (gen, kill) with instr.getDependencies(needed) == (needed & ~kill) | gen."""
+    gen = instr.getDependencies(0)
+    kill = FULL_MASK & ~instr.getDependencies(FULL_MASK)
+    return gen, kill
+
+class Liveness(object):
+    """
+    Backward liveness of registers over the basic blocks of a ProcedureGraph.
+
+    The instructions are taken from the structured flow built out of the graph, after
+    optimizedWithContext, and are assigned to their blocks by address. Blocks are summarised
+    by gen/kill masks and solved with a worklist. Instructions with no live results are then
+    removed and liveness is solved again, until nothing more can be removed.
+
+    Afterwards dead holds the removed instructions and labels, live_in and live_out the masks
+    live at the block boundaries. Calls have their returns_used set and labels their needed set.
+    """
+
+    def __init__(self, graph, content, labels, exit_needed):
+        self.graph = graph
+        self.labels = labels
+        self.exit_needed = exit_needed
+
+        self._block_of = dict()
+        for x in graph.vertices():
+            for instr in graph.getContents(x):
+                self._block_of[instr.addr.address] = x
+
+        # per block, instructions in order and masks read by the block's branch condition
+        self.code = [[] for x in graph.vertices()]
+        self.collect(content)
+
+        self.dead = set()
+        self._gen = [0] * len(self.code)
+        self._kill = [0] * len(self.code)
+        for x in graph.vertices():
+            self.summarize(x)
+
+        while True:
+            self.solve()
+            removed = self.sweep()
+            if not removed:
+                break
+            for x in removed:
+                self.summarize(x)
+
+        for x, label in labels.items():
+            if label.optimizeDependencies(self.liveAt(x)) is None:
+                self.dead.add(label)
+
+    def add(self, addr, item):
+        self.code[self._block_of[addr.address]].append(item)
+
+    def collect(self, node):
+        if isinstance(node, flowcontrol.Block):
+            for instr in node.contents:
+                self.collect(instr)
+        elif isinstance(node, flowcontrol.If):
+            self.add(node.split, node.cond.getDependencyMask())
+            if node.option_a:
+                self.collect(node.option_a)
+            if node.option_b:
+                self.collect(node.option_b)
+        elif isinstance(node, flowcontrol.Switch):
+            self.add(node.addr, node.arg.getDependencyMask())
+            for b in node.branches:
+                self.collect(b)
+        elif isinstance(node, flowcontrol.DoWhile):
+            self.collect(node.inner)
+            self.add(node.split, node.postcond.getDependencyMask())
+        elif isinstance(node, flowcontrol.While):
+            self.collect(node.inner)
+        elif not isinstance(node, (flowcontrol.Label, flowcontrol.FlowTerminator)):
+            self.add(node.addr, node)
+
+    def summarize(self, x):
+        gen = kill = 0
+        for item in reversed(self.code[x]):
+            if isinstance(item, int):
+                gen |= item
+            elif item not in self.dead:
+                g, k = genKill(item)
+                gen = (gen & ~k) | g
+                kill |= k
+        self._gen[x] = gen
+        self._kill[x] = kill
+
+    def liveAt(self, x):
+        """Mask live on entry to block x, None being the procedure exit."""
+        if x is None:
+            return self.exit_needed
+        return self.live_in[x]
+
+    def solve(self):
+        graph = self.graph
+        offsets, succ = graph.successors()
+        pred_offsets, pred = graph.predecessors()
+        exit = graph.EXIT
+        self.live_in = [0] * len(self.code)
+        self.live_out = [0] * len(self.code)
+
+        work = list(graph.vertices())
+        queued = [True] * len(self.code)
+        while work:
+            x = work.pop()
+            queued[x] = False
+
+            lo, hi = offsets[x], offsets[x+1]
+            if lo < hi:
+                out = 0
+                for i in xrange(lo, hi):
+                    ch = succ[i]
+                    out |= self.exit_needed if ch == exit else self.live_in[ch]
+            else:
+                out = self.exit_needed
+            self.live_out[x] = out
+
+            live = (out & ~self._kill[x]) | self._gen[x]
+            if live != self.live_in[x]:
+                self.live_in[x] = live
+                for i in xrange(pred_offsets[x], pred_offsets[x+1]):
+                    p = pred[i]
+                    if not queued[p]:
+                        queued[p] = True
+                        work.append(p)
+
+    def sweep(self):
+        """Remove the instructions with no live results, return the blocks changed."""
+        removed = []
+        for x in self.graph.vertices():
+            needed = self.live_out[x]
+            for item in reversed(self.code[x]):
+                if isinstance(item, int):
+                    needed |= item
+                elif item not in self.dead:
+                    if item.optimizeDependencies(needed) is None:
+                        self.dead.add(item)
+                        if not removed or removed[-1] != x:
+                            removed.append(x)
+                    else:
+                        needed = item.getDependencies(needed)
+        return removed
@@ -0,0 +1,60 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gc
+import sys
+import types
+
+# shared by the whole program, never owned by a cache entry
+NOT_FOLLOWED = (type, types.ClassType, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+def footprint(roots, skip=()):
+    """
+    Bytes held by the objects reachable from roots, counting every object once.
+    Classes, modules, functions and the objects in skip are not followed.
+    """
+    seen = set(id(x) for x in skip)
+    stack = list(roots)
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, NOT_FOLLOWED):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+def perItem(size, count):
+    if not count:
+        return 0
+    return size // count
+
+class MemoryStats(object):
+    """Memory held by the decoded instruction cache and the procedure flow cache of a project."""
+
+    def __init__(self, proj):
+        self.decoded = len(proj.disasm.cache)
+        self.decoded_bytes = footprint(proj.disasm.cache.values(), [proj])
+        self.procs = len(proj.flow.cache)
+        self.flow_instructions = proj.flow.size
+        self.flow_bytes = footprint(proj.flow.cache.values(), [proj])
+
+    def __str__(self):
+        return ('{0} decoded instructions in {1} bytes ({2} per instruction), '
+                '{3} procs with {4} instructions in {5} bytes ({6} per instruction)').format(
+            self.decoded, self.decoded_bytes, perItem(self.decoded_bytes, self.decoded),
+            self.procs, self.flow_instructions, self.flow_bytes, perItem(self.flow_bytes, self.flow_instructions))
@@ -20,22 +20,26 @@ from awake.singledecoder import SingleOpcodeDecoder
 class OpcodeDispatcher(object):
 
     def __init__(self, opcodeFormats):
-        self.dispatchTable = dict()
+        decoders = [None] * 256
         for bit_format in opcodeFormats:
             if not bit_format:
                 continue
 
             decoder = SingleOpcodeDecoder(bit_format)
-            for i in range(256):
-                byte = i & 0xFF
+            for byte in range(256):
                 if decoder.match(byte):
-                    self.dispatchTable[byte] = decoder
+                    decoders[byte] = decoder
+
+        self.dispatchTable = [None] * 256
+        for byte, decoder in enumerate(decoders):
+            if decoder:
+                self.dispatchTable[byte] = decoder.compiled(byte)
 
     def decode(self, proj, addr):
         entry = proj.rom.get(addr)
-        if entry not in self.dispatchTable:
+        record = self.dispatchTable[entry]
+        if not record:
             print('WARN: bad opcode', addr)
             return BadOpcode([entry], addr), None
-        decoder = self.dispatchTable[entry]
-        opcodes = proj.rom.read(addr, decoder.length())
-        return decoder.decode(proj, opcodes, addr)
+        opcodes = proj.rom.read(addr, record.length)
+        return record.decode(proj, opcodes, addr)
@@ -46,10 +46,10 @@ class OpcodeEffect(object):
         self.writes = writes
         self.values = values
 
-    def filled(self, params, ctx):
+    def template(self, params):
+        """Resolve opcode parameters. Returns reads, writes and a list of (name, unoptimized expression) loads."""
         reads = set()
         writes = set()
-        values = dict()
         loads = []
 
         for x in self.reads:
@@ -78,18 +78,10 @@ class OpcodeEffect(object):
                 else:
                     name = operand.name
                     writes |= splitRegister(name)
-                if x in self.values:
-                    e = parse(self.values[x])
-                    values[name] = e.optimizedWithContext(ctx)
-                    loads.append((name, values[name]))
             else:
+                name = x
                 writes |= splitRegister(x)
-                if x in self.values:
-                    e = parse(self.values[x])
-                    values[x] = e.optimizedWithContext(ctx)
-                    loads.append((x, values[x]))
-
-        #values = dict() # TODO: XXX:
-        #loads = []
+            if x in self.values:
+                loads.append((name, parse(self.values[x])))
 
-        return reads, writes, values, loads
+        return reads, writes, loads
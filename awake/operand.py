@@ -14,14 +14,82 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import weakref
 from awake import address
-from awake.regutil import REGS16, splitRegister
+from awake.regutil import REGS16, registerMask, splitRegister
+
+class Interned(type):
+    """
+    Hash-consing of expression nodes. Constructing a node with the same class and arguments
+    as a live one returns the existing object. Operand arguments are matched by identity,
+    which is exact because they are interned themselves.
+
+    Node classes get empty __slots__ unless they list their own attributes, so nodes carry
+    no per-instance dict.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        namespace.setdefault('__slots__', ())
+        return super(Interned, mcs).__new__(mcs, name, bases, namespace)
+
+    def __init__(cls, name, bases, namespace):
+        super(Interned, cls).__init__(name, bases, namespace)
+        cls._instances = weakref.WeakValueDictionary()
+
+    def __call__(cls, *args, **kwargs):
+        if kwargs or not cls.interned:
+            return type.__call__(cls, *args, **kwargs)
+        key = tuple([id(x) if isinstance(x, Operand) else x for x in args])
+        try:
+            return cls._instances[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable argument
+            return type.__call__(cls, *args)
+        obj = type.__call__(cls, *args)
+        cls._instances[key] = obj
+        return obj
+
+def cachedByContext(optimize):
+    """
+    Remember the last optimizedWithContext result of a node, keyed by the context version.
+    The version and result are stored as one tuple, so threads sharing the node never see
+    a result with the version of another.
+    """
+    def optimizedWithContext(self, ctx):
+        try:
+            version, result = self._opt
+            if version == ctx.version:
+                return result
+        except AttributeError:
+            pass
+        result = optimize(self, ctx)
+        self._opt = (ctx.version, result)
+        return result
+    return optimizedWithContext
 
 class Operand(object):
+    __metaclass__ = Interned
+    __slots__ = ('_deps', '_mask', '_opt', '__weakref__')
+    interned = True
     bits = 8
     childs = ()
     value = None
 
+    def __getstate__(self):
+        # context versions are only meaningful in this process, so the memo is not pickled
+        state = dict()
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name not in ('_opt', '__weakref__') and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     @property
     def value_mask(self):
         if self.value is not None:
@@ -40,6 +108,22 @@ class Operand(object):
         return self
 
     def getDependencies(self):
+        """Registers and memory the value depends on. Nodes are immutable, so the set is computed once."""
+        try:
+            return self._deps
+        except AttributeError:
+            self._deps = frozenset(self._dependencies())
+            return self._deps
+
+    def getDependencyMask(self):
+        """Registers of getDependencies as a mask, see regutil.registerMask."""
+        try:
+            return self._mask
+        except AttributeError:
+            self._mask = registerMask(self.getDependencies())
+            return self._mask
+
+    def _dependencies(self):
         return set.union(set(), *(ch.getDependencies() for ch in self.childs))
 
     def needParen(self, priority):
@@ -49,6 +133,7 @@ class Operand(object):
         return set(dep for dep in self.getDependencies() if isinstance(dep, address.Address))
 
 class Constant(Operand):
+    __slots__ = ('value',)
     def __init__(self, value):
         assert isinstance(value, int)
         self.value = value
@@ -78,6 +163,9 @@ class Constant(Operand):
             return 8
 
 class ComplexValue(Operand):
+    __slots__ = ('hint', 'deps')
+    interned = False
+
     def __init__(self, hint='complex', deps=None):
         self.hint = hint
         if deps:
@@ -88,7 +176,7 @@ class ComplexValue(Operand):
     def isComplex(self):
         return True
 
-    def getDependencies(self):
+    def _dependencies(self):
         return self.deps
 
     def __str__(self):
@@ -96,6 +184,7 @@ class ComplexValue(Operand):
 
 
 class AddressConstant(Constant):
+    __slots__ = ('addr',)
     def __init__(self, addr):
         if not hasattr(addr, 'virtual'):
             if isinstance(addr, int):                       #If addr is an int,
@@ -140,6 +229,7 @@ class JumpTableAddress(AddressConstant):
     html_class = "jumptable-addr"
 
 class Register(Operand):
+    __slots__ = ('name',)
     def __init__(self, name):
         self.name = name
 
@@ -154,7 +244,7 @@ class Register(Operand):
             return ctx.getValue(self.name)
         return self
 
-    def getDependencies(self):
+    def _dependencies(self):
         return splitRegister(self.name)
 
     def __hash__(self):
@@ -188,7 +278,10 @@ class Condition(Register):
 
 
 class Dereference(Operand):
+    __slots__ = ('target', 'addr', 'childs', 'source')
     def __init__(self, target, addr=None):
+        # the node is interned by the id of target, so target has to live as long as the node
+        self.source = target
         self.addr = addr
         if hasattr(target, "getAddress"):
             self.target = target
@@ -210,13 +303,14 @@ class Dereference(Operand):
         self.target.render(renderer)
         renderer.add(']')
 
+    @cachedByContext
     def optimizedWithContext(self, ctx):
         target = self.target.optimizedWithContext(ctx)
         if not hasattr(target, 'getAddress') and target.value is not None:
             target = DataAddress(address.fromVirtual(target.value)).optimizedWithContext(ctx)
         return Dereference(target, self.addr)
 
-    def getDependencies(self):
+    def _dependencies(self):
         out = set(['mem']) | self.target.getDependencies()
         if hasattr(self.target, 'getAddress'):
             out |= set([self.target.getAddress()])
@@ -226,7 +320,7 @@ class Dereference(Operand):
         return hash((Dereference, self.target))
 
     def __eq__(self, other):
-        return isinstance(other, Dereference) and self.target == other.target
+        return self is other or isinstance(other, Dereference) and self.target == other.target
 
     # XXX
     #def getMemreads(self):
@@ -236,6 +330,7 @@ class Dereference(Operand):
 
 
 class ComputedProcAddress(Operand):
+    __slots__ = ('bank', 'addr', 'childs')
     bits = 24
 
     def __init__(self, bank, addr):
@@ -253,6 +348,7 @@ class ComputedProcAddress(Operand):
         self.addr.render(renderer)
         renderer.add(']')
 
+    @cachedByContext
     def optimizedWithContext(self, ctx):
         bank = self.bank.optimizedWithContext(ctx)
         addr = self.addr.optimizedWithContext(ctx)
@@ -262,11 +358,11 @@ class ComputedProcAddress(Operand):
 
         return ComputedProcAddress(bank, addr)
 
-    def getDependencies(self):
+    def _dependencies(self):
         return self.addr.getDependencies() | self.bank.getDependencies()
 
     def __hash__(self):
         return hash((ComputedProcAddress, self.bank, self.addr))
 
     def __eq__(self, other):
-        return isinstance(other, ComputedProcAddress) and self.addr == other.addr and self.bank == other.bank
+        return self is other or isinstance(other, ComputedProcAddress) and self.addr == other.addr and self.bank == other.bank
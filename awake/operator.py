@@ -14,9 +14,10 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from awake.operand import Constant, Operand
+from awake.operand import Constant, Operand, cachedByContext
 
 class Operator(Operand):
+    __slots__ = ('childs',)
 
     def __init__(self, *args):
         self.childs = args
@@ -25,6 +26,7 @@ class Operator(Operand):
     #def getMemreads(self):
     #    return set.union(set(), *(ch.getMemreads() for ch in self.childs))
 
+    @cachedByContext
     def optimizedWithContext(self, ctx):
         childs = (ch.optimizedWithContext(ctx) for ch in self.childs)
         return self.__class__.make(*childs)
@@ -37,6 +39,7 @@ def isConstant(x):
     return x.value is not None
 
 class BinOp(Operator):
+    __slots__ = ('left', 'right', '_hash')
     symbol = None
 
     def __init__(self, left, right):
@@ -57,9 +60,15 @@ class BinOp(Operator):
         return '{0} {1} {2}'.format(left, self.symbol, right)
 
     def __hash__(self):
-        return hash((self.symbol, self.left, self.right))
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash((self.symbol, self.left, self.right))
+            return self._hash
 
     def __eq__(self, other):
+        if self is other:
+            return True
         try:
             return self.symbol == other.symbol and self.left == other.left and self.right == other.right
         except AttributeError:
@@ -380,6 +389,7 @@ class Shr16(BinOp):
         return (a >> b) & 0xFFFF
 
 class FuncOperator(Operator):
+    __slots__ = ('_hash',)
     name = None
 
     def __str__(self):
@@ -392,11 +402,17 @@ class FuncOperator(Operator):
         renderer.add(')')
 
     def __hash__(self):
-        return hash((self.name, self.args))
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash((self.name, self.childs))
+            return self._hash
 
     def __eq__(self, other):
+        if self is other:
+            return True
         try:
-            return self.name == other.name and self.args == other.args
+            return self.name == other.name and self.childs == other.childs
         except AttributeError:
             return False
 
@@ -410,8 +426,8 @@ class FuncOperator(Operator):
 class PopValue(FuncOperator):
     name = 'popval'
 
-    def getDependencies(self):
-        return FuncOperator.getDependencies(self) | set(['mem'])
+    def _dependencies(self):
+        return FuncOperator._dependencies(self) | set(['mem'])
 
     @classmethod
     def make(cls, a):
@@ -422,8 +438,8 @@ class PopValue(FuncOperator):
 class PopStack(FuncOperator):
     name = 'popst'
 
-    def getDependencies(self):
-        return FuncOperator.getDependencies(self) | set(['mem'])
+    def _dependencies(self):
+        return FuncOperator._dependencies(self) | set(['mem'])
 
     @classmethod
     def make(cls, a):
@@ -435,8 +451,8 @@ class PopStack(FuncOperator):
 class Push(FuncOperator):
     name = 'push'
 
-    def getDependencies(self):
-        return FuncOperator.getDependencies(self) | set(['mem'])
+    def _dependencies(self):
+        return FuncOperator._dependencies(self) | set(['mem'])
 
 class CarryOfAdd(FuncOperator):
     name = 'c_add'
@@ -0,0 +1,190 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import struct
+from bisect import bisect_right
+from awake import address
+
+CODE = 1
+JUMPTABLE = 2
+
+_run_pattern = re.compile(b'\x01+|\x02+')
+
+def regionEnd(addr):
+    """First address that cannot be reached from addr by offsetting forward without changing the bank."""
+    if addr.inBankedSpace() and not addr.isAmbiguous():
+        return address.fromVirtualAndBank(0x8000, addr.bank())
+    return address.Address((addr.address & ~0xFFFF) + 0x10000)
+
+class OwnedBytes(object):
+    """Set of owned addresses in [start, limit), one byte per address."""
+
+    def __init__(self, start, limit):
+        self.base = start.address
+        end = min(limit, regionEnd(start))
+        self.bits = bytearray(max(0, end.address - self.base))
+
+    def _offset(self, addr):
+        return addr.address - self.base
+
+    def addressAt(self, offset):
+        return address.Address(self.base + offset)
+
+    def __contains__(self, addr):
+        offset = self._offset(addr)
+        return 0 <= offset < len(self.bits) and self.bits[offset] != 0
+
+    def __len__(self):
+        return len(self.bits) - self.bits.count(b'\x00')
+
+    def __iter__(self):
+        for offset, owned in enumerate(self.bits):
+            if owned:
+                yield self.addressAt(offset)
+
+    def span(self, addr, size):
+        """Number of bytes from addr on, up to size, that lie inside the map."""
+        return max(0, min(size, len(self.bits) - self._offset(addr)))
+
+    def isClear(self, addr, size):
+        offset = self._offset(addr)
+        return self.bits.count(b'\x00', offset, offset + size) == size
+
+    def add(self, addr, kind=CODE):
+        self.bits[self._offset(addr)] = kind
+
+    def addRange(self, addr, size, kind=CODE):
+        offset = self._offset(addr)
+        self.bits[offset:offset+size] = bytearray([kind]) * size
+
+    def firstClear(self, addr):
+        """First address from addr on that is not owned, or the end of the map."""
+        offset = self.bits.find(b'\x00', self._offset(addr))
+        if offset < 0:
+            offset = len(self.bits)
+        return self.addressAt(offset)
+
+    def cut(self, limit):
+        del self.bits[max(0, self._offset(limit)):]
+
+    def runs(self):
+        """List of (address, length, kind) for each run of consecutive bytes owned with the same kind."""
+        return [(self.addressAt(m.start()), m.end() - m.start(), ord(m.group()[:1]))
+                for m in _run_pattern.finditer(bytes(self.bits))]
+
+_run_struct = struct.Struct('<HHIB')
+
+class OwnershipMap(object):
+    """Which procedure owns each ROM byte, kept per bank as sorted runs of (start, end, owner, kind).
+
+    Start and end are virtual addresses, owner is the integer address of the owning procedure.
+    Bytes owned by more than one procedure are conflicts.
+    """
+
+    def __init__(self):
+        self.banks = dict()
+        self.max_length = dict()
+
+    def _bankRuns(self, bank):
+        if bank not in self.banks:
+            self.banks[bank] = []
+            self.max_length[bank] = 0
+        return self.banks[bank]
+
+    def setOwner(self, owner, runs):
+        """Replace everything owned by owner with runs of (address, length, kind)."""
+        bank = owner.bank()
+        bank_runs = [x for x in self._bankRuns(bank) if x[2] != owner.address]
+
+        for addr, length, kind in runs:
+            if not addr.inPhysicalMem() or addr.isAmbiguous() or addr.bank() != bank:
+                continue
+            if addr.inBankedSpace():
+                region_end = 0x8000
+            else:
+                region_end = 0x4000
+            end = min(addr.virtual() + length, region_end)
+            bank_runs.append((addr.virtual(), end, owner.address, kind))
+            self.max_length[bank] = max(self.max_length[bank], end - addr.virtual())
+
+        bank_runs.sort()
+        self.banks[bank] = bank_runs
+        return bank
+
+    def _runsAt(self, addr):
+        bank_runs = self.banks.get(addr.bank(), [])
+        virtual = addr.virtual()
+        i = bisect_right(bank_runs, (virtual, 0x10000))
+        lowest = virtual - self.max_length.get(addr.bank(), 0)
+        while i > 0 and bank_runs[i-1][0] >= lowest:
+            i -= 1
+            if bank_runs[i][1] > virtual:
+                yield bank_runs[i]
+
+    def ownersAt(self, addr):
+        return set(address.Address(x[2]) for x in self._runsAt(addr))
+
+    def kindAt(self, addr):
+        for x in self._runsAt(addr):
+            return x[3]
+
+    def ownedBy(self, owner):
+        return [(address.fromVirtualAndBank(x[0], owner.bank()), x[1] - x[0], x[3])
+                for x in self.banks.get(owner.bank(), []) if x[2] == owner.address]
+
+    def nextOwnedAddress(self, addr):
+        """Start of the first run owned by someone other than the owner of addr, after addr."""
+        owners = set(x[2] for x in self._runsAt(addr))
+        for x in self.banks.get(addr.bank(), []):
+            if x[0] > addr.virtual() and x[2] not in owners:
+                return address.fromVirtualAndBank(x[0], addr.bank())
+
+    def coverage(self, bank):
+        """Number of bytes in bank owned by at least one procedure."""
+        total = 0
+        covered_to = 0
+        for start, end, _, _ in self.banks.get(bank, []):
+            start = max(start, covered_to)
+            if end > start:
+                total += end - start
+                covered_to = end
+        return total
+
+    def conflicts(self, bank):
+        """List of (address, owners) for every run start where ranges of different procedures overlap."""
+        out = []
+        active = []
+        for start, end, owner, _ in self.banks.get(bank, []):
+            active = [x for x in active if x[0] > start]
+            owners = set(x[1] for x in active if x[1] != owner)
+            if owners:
+                owners.add(owner)
+                out.append((address.fromVirtualAndBank(start, bank), set(address.Address(x) for x in owners)))
+            active.append((end, owner))
+        return out
+
+    def encodeBank(self, bank):
+        return b''.join(_run_struct.pack(start, end - start, owner, kind) for start, end, owner, kind in self.banks.get(bank, []))
+
+    def decodeBank(self, bank, blob):
+        blob = bytes(blob)
+        runs = self._bankRuns(bank)
+        for i in range(0, len(blob), _run_struct.size):
+            start, length, owner, kind = _run_struct.unpack_from(blob, i)
+            runs.append((start, start + length, owner, kind))
+            self.max_length[bank] = max(self.max_length[bank], length)
+        runs.sort()
@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from awake import address
+from awake.database import bankRange
 from awake.operand import ProcAddress, DataAddress
 from awake.procedure import loadProcedureRange
 from awake.jumptable import JumpTable
@@ -130,6 +131,7 @@ class SummaryPage(Page):
         pass
         
     def render(self, renderer):
+        self.proj.database.flush()
         c = self.proj.database.connection.cursor()
 
         c.execute('select addr from procs where has_ambig_calls=1')
@@ -164,13 +166,14 @@ class BankSummaryPage(Page):
         self.bank = int(p[2], 16)
         
     def render(self, renderer):
-        bank_name = "{:04X}".format(self.bank)
+        lo, hi = bankRange(self.bank)
 
+        self.proj.database.flush()
         c = self.proj.database.connection.cursor()
 
         renderer.startNewLine()
         renderer.add('public interface:')
-        c.execute('select destination from calls where substr(source, 0, 5)<>? and substr(destination, 0, 5)=? group by destination order by destination', (bank_name, bank_name))
+        c.execute('select destination from calls where (source<? or source>=?) and destination>=? and destination<? group by destination order by destination', (lo, hi, lo, hi))
         with renderer.indent():
             for addr, in c.fetchall():
                 renderer.startNewLine()
@@ -178,7 +181,7 @@ class BankSummaryPage(Page):
 
         renderer.startNewLine()
         renderer.add('dependencies:')
-        c.execute('select destination from calls where substr(source, 0, 5)=? and substr(destination, 0, 5)<>? group by source order by source', (bank_name, bank_name))
+        c.execute('select destination from calls where source>=? and source<? and (destination<? or destination>=?) group by source order by source', (lo, hi, lo, hi))
         with renderer.indent():
             for addr, in c.fetchall():
                 renderer.startNewLine()
@@ -186,7 +189,7 @@ class BankSummaryPage(Page):
 
         renderer.startNewLine()
         renderer.add('reads:')
-        c.execute('select addr from memref where substr(proc, 0, 5)=? and type=? group by addr order by addr', (bank_name, 'read'))
+        c.execute('select addr from memref where proc>=? and proc<? and type=? group by addr order by addr', (lo, hi, 'read'))
         with renderer.indent():
             for addr, in c.fetchall():
                 renderer.startNewLine()
@@ -194,7 +197,7 @@ class BankSummaryPage(Page):
 
         renderer.startNewLine()
         renderer.add('writes:')
-        c.execute('select addr from memref where substr(proc, 0, 5)=? and type=? group by addr order by addr', (bank_name, 'write'))
+        c.execute('select addr from memref where proc>=? and proc<? and type=? group by addr order by addr', (lo, hi, 'write'))
         with renderer.indent():
             for addr, in c.fetchall():
                 renderer.startNewLine()
@@ -0,0 +1,110 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import multiprocessing
+from awake.discovery import Discovery, discover
+from awake.flow import ProcSummary
+from awake.project import Project
+
+# project of a worker process. Forked workers inherit the one of the writer, with its rom and decode tables ready.
+_worker_proj = None
+# last wave the worker has caught up with
+_worker_wave = None
+
+def _initWorker(filename, config):
+    global _worker_proj
+    if _worker_proj is None:
+        _worker_proj = Project(filename, config, True)
+    else:
+        _worker_proj.database.reconnect()
+    _worker_proj.database.setReadOnly()
+
+def _syncWorker():
+    """Pick up the procs and dependency sets the writer saved since the last wave."""
+    database = _worker_proj.database
+    database.reloadProcIndex()
+    disasm = _worker_proj.disasm
+    disasm.invalidateChangedCalls(database.getEncodedDepsets(disasm.call_sites))
+
+def _analyzeInWorker(task):
+    global _worker_wave
+    wave, addr = task
+    try:
+        if wave != _worker_wave:
+            _syncWorker()
+            _worker_wave = wave
+        return addr, ProcSummary(_worker_proj.flow.analyze(addr)), None
+    except Exception as e:
+        return addr, None, '{0}: {1}'.format(type(e).__name__, e)
+
+def numProcesses(proj, jobs=None):
+    if not jobs:
+        jobs = proj.config.get(['Analysis-Processes'])
+    if not jobs:
+        jobs = multiprocessing.cpu_count()
+    return jobs
+
+def discoverParallel(proj, seeds=None, max_steps=None, report=None, jobs=None):
+    """
+    Same as discover, with the analysis spread over a pool of worker processes.
+
+    The worklist is processed one wave at a time by a single pool, whose workers read
+    the rom and the database, analyse their share of the wave and send back a ProcSummary
+    of each proc. This process is the only one writing the database. It flushes before
+    every wave, and each worker catches up with the new procs and dependency sets when it
+    gets its first proc of a wave. Procs affected by a wave are queued for a later one.
+    """
+    jobs = numProcesses(proj, jobs)
+    if jobs == 1:
+        return discover(proj, seeds, max_steps, report)
+
+    global _worker_proj
+    database = proj.database
+    discovery = Discovery(proj, seeds, max_steps, report)
+    database.flush()
+
+    _worker_proj = proj
+    pool = multiprocessing.Pool(jobs, _initWorker, (proj.filename, proj.config))
+    _worker_proj = None
+    try:
+        while discovery.stepsLeft():
+            batch = discovery.nextWave()
+            database.flush()
+
+            tasks = [(discovery.stats.waves, x) for x in batch]
+            chunksize = max(1, len(tasks) // (jobs * 8))
+            changed = set()
+            for x, summary, error in pool.imap(_analyzeInWorker, tasks, chunksize):
+                if summary is None:
+                    discovery.fail(x, error)
+                    continue
+                old_depset = database.procInfo(x).depset
+                proj.flow.drop(x)
+                proj.flow.save(summary)
+                if discovery.update(x, old_depset, summary):
+                    changed.add(x)
+                # callees that changed earlier in this wave were not known to x yet when it was saved
+                if changed & (summary.calls() | summary.tailCalls()):
+                    discovery.enqueue(x)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return discovery.finish()
@@ -14,10 +14,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from array import array
 from collections import defaultdict
 from awake import address
 from awake.instruction import TailCall
 from awake.operand import ProcAddress
+from awake.ownership import CODE, JUMPTABLE, OwnedBytes
 
 def manualJumptableLimit(addr):
     if addr == address.fromConventional("0001:4187"):
@@ -82,10 +84,11 @@ class ProcedureRangeAnalysis(object):
         self.start_addr = addr
         self.limit_addr = limit
         self.visited = set()
-        self.owned_bytes = set()
+        self.owned_bytes = OwnedBytes(addr, limit)
         self.labels = set()
         self.block_starts = set([self.start_addr])
         self.jumptable_sizes = defaultdict(int)
+        self.call_sites = dict()
         self.queue = set([self.start_addr])
         self.jumptable_queue = set()
         self.suspicious_switch = False
@@ -104,20 +107,26 @@ class ProcedureRangeAnalysis(object):
     def isAvailableAddr(self, addr):
         return self.isLocalAddr(addr) and addr not in self.owned_bytes
 
-    def ownByte(self, addr):
+    def ownByte(self, addr, kind=CODE):
         if not self.isAvailableAddr(addr):
             print('byte not available', addr, 'visited:', ', '.join(str(x) for x in self.visited))
             print("LOG:", "\n".join(self.log))
         assert self.isAvailableAddr(addr)
-        self.owned_bytes.add(addr)
+        self.owned_bytes.add(addr, kind)
 
-    def ownByteRange(self, addr, size):
-        for i in range(size):
-            if not self.isLocalAddr(addr.offset(i)):
-                print('megawarn: overlap instr', addr, addr.offset(i))
-                self.warn = True
-                return
-            self.ownByte(addr.offset(i))
+    def ownByteRange(self, addr, size, kind=CODE):
+        local_size = 0
+        if self.isLocalAddr(addr):
+            local_size = min(self.owned_bytes.span(addr, size), self.limit_addr.address - addr.address)
+
+        if not self.owned_bytes.isClear(addr, local_size):
+            for i in range(local_size):
+                self.ownByte(addr.offset(i), kind)
+        self.owned_bytes.addRange(addr, local_size, kind)
+
+        if local_size < size:
+            print('megawarn: overlap instr', addr, addr.offset(local_size))
+            self.warn = True
 
     def tryExpandJumptable(self, proj, jumptable_addr):
 
@@ -144,7 +153,7 @@ class ProcedureRangeAnalysis(object):
 
         # everything ok, expand jumptable
         self.jumptable_sizes[jumptable_addr] += 1
-        self.ownByteRange(next_target_addr, 2)
+        self.ownByteRange(next_target_addr, 2, JUMPTABLE)
         self.jumptable_queue.add(jumptable_addr)
         self.queue.add(next_target)
         self.labels.add(next_target)
@@ -160,9 +169,10 @@ class ProcedureRangeAnalysis(object):
 
         self.visited.add(addr)
 
-        instr, next_addr = proj.disasm._decode(addr)
+        step = proj.disasm.decodeFlow(addr)
+        next_addr = step.next_addr
 
-        self.log.append('instr ' + str(addr) + ' ' + str(instr))
+        self.log.append('instr ' + str(addr) + ' ' + str(step))
 
         if next_addr:
             length = next_addr.virtual() - addr.virtual()
@@ -173,21 +183,24 @@ class ProcedureRangeAnalysis(object):
             raise "bla"
             self.ownByte(addr)
 
-        if instr.name == 'switch':
+        if step.is_switch:
             self.jumptable_queue.add(next_addr)
             return
 
-        if instr.hasContinue():
+        if step.has_continue:
             self.queue.add(next_addr)
-            if instr.name == 'RET' or instr.allJumps():  # TODO: XXX: maybe not nicest
+            if step.name == 'RET' or step.all_jumps:  # TODO: XXX: maybe not nicest
                 self.block_starts.add(next_addr)
 
-        for jump_addr in instr.jumps():
+        for jump_addr in step.jumps:
             self.queue.add(jump_addr)
             self.labels.add(jump_addr)
             self.block_starts.add(jump_addr)
 
-        for call_addr in instr.calls():
+        if step.calls or step.jumps:
+            self.call_sites[addr] = set(step.calls) | set(step.jumps)
+
+        for call_addr in step.calls:
             if call_addr != self.start_addr:
                 self.shrinkLimit(call_addr)
 
@@ -201,19 +214,21 @@ class ProcedureRangeAnalysis(object):
                 self.tryExpandJumptable(proj, x)
 
     def firstGap(self):
-        addr = self.start_addr
-        while addr < self.limit_addr and not self.isAvailableAddr(addr):
-            addr = addr.offset(1)
-        return addr
+        return min(self.owned_bytes.firstClear(self.start_addr), self.limit_addr)
 
     def shrinkLimitAndCut(self, limit_addr):
         self.limit_addr = limit_addr
-        #self.owned_bytes = set(addr for addr in self.owned_bytes if self.isLocalAddr(addr))
-        self.owned_bytes = list(filter(self.isLocalAddr, self.owned_bytes))
+        self.owned_bytes.cut(limit_addr)
         self.visited = set(addr for addr in self.visited if self.isLocalAddr(addr))
         self.labels = set(addr for addr in self.labels if self.isLocalAddr(addr))
         self.block_starts = set(addr for addr in self.block_starts if self.isLocalAddr(addr))
         self.jumptable_sizes = dict((k, v) for (k, v) in self.jumptable_sizes.items() if self.isLocalAddr(k))
+        self.call_sites = dict((k, v) for (k, v) in self.call_sites.items() if self.isLocalAddr(k))
+
+    def calls(self):
+        """Targets of the calls and tail jumps found in the range, before any flow analysis."""
+        targets = set().union(*self.call_sites.values())
+        return set(x for x in targets if x == self.start_addr or not self.isLocalAddr(x))
 
     def render(self, renderer):
         for addr in sorted(self.visited):
@@ -235,41 +250,53 @@ def getLimit(proj, addr):
         return next_owned
 
 class ProcedureGraph(object):
+    """Control flow graph of a procedure.
+
+    Vertices are block numbers. Edges are kept in compressed sparse row form:
+    the childs of x are stored in _succ[_succ_offsets[x]:_succ_offsets[x+1]],
+    with EXIT standing for None (return from the procedure). Parents are stored
+    the same way, with the exit vertex at index num_blocks.
+
+    The graph algorithms in flow, ssa and liveness walk these arrays directly,
+    see successors and predecessors. childs and parents give the same edges as
+    lists, with None for the exit.
+    """
+
+    EXIT = -1
+
     def __init__(self, proj, start_addr, end_addr, block_starts, jumptable_sizes):
         self.start_addr = start_addr
         self.end_addr = end_addr
         self.jumptable_sizes = jumptable_sizes
-        block_starts = list(sorted(block_starts))
-        self.block_starts = block_starts
-        self.block_id_at_addr = dict((block_starts[i], i) for i in range(len(block_starts)))
-        self.block_id_at_addr[None] = None
-        self._childs = dict()
+        block_starts = sorted(block_starts)
+        self.block_offsets = array('l', (addr.address for addr in block_starts))
+        self._block_id = dict((addr.address, i) for i, addr in enumerate(block_starts))
         self.blocks = [None] * len(block_starts)
+        self._edges = [None] * len(block_starts)
         self.addBlocks(proj)
-        self._parents = defaultdict(list)
-        self._fillParents()
+        self._buildEdges()
 
     def addBlocks(self, proj):
         num_blocks = len(self.blocks)
         for i in range(num_blocks):
-            start_addr = self.block_starts[i]
+            start_addr = address.Address(self.block_offsets[i])
             if i+1 < num_blocks:
-                end_addr = self.block_starts[i+1]
+                end_addr = address.Address(self.block_offsets[i+1])
             else:
                 end_addr = self.end_addr
             self.addBlock(proj, i, start_addr, end_addr)
 
     def addFakeBlock(self, proj, addr):
         pos = len(self.blocks)
-        self.block_id_at_addr[addr] = pos
+        self._block_id[addr.address] = pos
 
         instr = TailCall(proj, ProcAddress(addr))
 
         from .flowcontrol import Block
-        self.blocks.append(Block([instr]))
+        self.blocks.append(Block.split([instr]))
 
-        self.block_starts.append(addr)
-        self._childs[pos] = [None]
+        self.block_offsets.append(addr.address)
+        self._edges.append([self.EXIT])
 
     def addBlock(self, proj, pos, start_addr, end_addr):
 
@@ -307,34 +334,70 @@ class ProcedureGraph(object):
             instructions = instructions[:-1]
 
         from .flowcontrol import Block
-        block = Block(instructions)
+        block = Block.split(instructions)
         self.blocks[pos] = block
 
         for ch in childs:
-            if ch not in self.block_starts:
-                if ch is not None:
-                    self.addFakeBlock(proj, ch)
+            if ch is not None and ch.address not in self._block_id:
+                self.addFakeBlock(proj, ch)
 
-        self._childs[self.block_id_at_addr[start_addr]] = [self.block_id_at_addr[ch] for ch in childs]
+        self._edges[pos] = [self.EXIT if ch is None else self._block_id[ch.address] for ch in childs]
 
-    def _fillParents(self):
-        for x in self.vertices():
-            for ch in self.childs(x):
-                self._parents[ch].append(x)  # important: duplicate childs must be supported
+    def _buildEdges(self):
+        num_blocks = len(self.blocks)
+        edges = self._edges
+        del self._edges
+
+        self._succ_offsets = array('l', [0])
+        self._succ = array('l')
+        for x in range(num_blocks):
+            self._succ.extend(edges[x])
+            self._succ_offsets.append(len(self._succ))
+
+        # important: duplicate childs must be supported
+        counts = [0] * (num_blocks + 1)
+        for ch in self._succ:
+            counts[num_blocks if ch == self.EXIT else ch] += 1
+        self._pred_offsets = array('l', [0])
+        for i in range(num_blocks + 1):
+            self._pred_offsets.append(self._pred_offsets[i] + counts[i])
+        fill = list(self._pred_offsets)
+        self._pred = array('l', [0]) * len(self._succ)
+        for x in range(num_blocks):
+            for ch in edges[x]:
+                i = num_blocks if ch == self.EXIT else ch
+                self._pred[fill[i]] = x
+                fill[i] += 1
 
     def start(self):
         return 0
 
+    def numBlocks(self):
+        return len(self.blocks)
+
+    def successors(self):
+        """CSR arrays (offsets, succ) of the childs, EXIT marking a return."""
+        return self._succ_offsets, self._succ
+
+    def predecessors(self):
+        """CSR arrays (offsets, pred) of the parents, those of the exit at index numBlocks()."""
+        return self._pred_offsets, self._pred
+
     def parents(self, x):
-        return self._parents[x]
+        if x is None:
+            x = len(self.blocks)
+        return self._pred[self._pred_offsets[x]:self._pred_offsets[x+1]].tolist()
 
     def childs(self, x):
         if x is None:
             return []
-        return self._childs[x]
+        return [None if ch == self.EXIT else ch for ch in self._succ[self._succ_offsets[x]:self._succ_offsets[x+1]]]
 
     def vertices(self):
-        return set(range(len(self.blocks)))
+        return xrange(len(self.blocks))
+
+    def blockAddress(self, x):
+        return address.Address(self.block_offsets[x])
 
     def skipSimpleJumps(self, x):
         if x and not self.blocks[x] and len(self.childs(x)) == 1 and self.childs(x)[0] is None:
@@ -388,8 +451,11 @@ def loadProcedureRange(proj, addr):
     return ProcedureRangeAnalysis(proj, addr, getLimit(proj, addr))
 
 def loadProcedureGraph(proj, addr):
-    r = loadProcedureRange(proj, addr)
-    g = ProcedureGraph(proj, addr, r.limit_addr, r.block_starts, r.jumptable_sizes)
+    return graphFromRange(proj, loadProcedureRange(proj, addr))
+
+def graphFromRange(proj, r):
+    g = ProcedureGraph(proj, r.start_addr, r.limit_addr, r.block_starts, r.jumptable_sizes)
     g.suspicious_switch = r.suspicious_switch
     g.warn = r.warn
+    g.owned_runs = r.owned_bytes.runs()
     return g
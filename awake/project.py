@@ -42,6 +42,7 @@ class Project(object):
 
     def close(self):
     	self.database.close()
+    	self.rom.close()
 
     def openCopy(self):
         """Create a project mirror for safe use from different thread"""
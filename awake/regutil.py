@@ -37,6 +37,41 @@ def splitRegisters(regs):
         out |= splitRegister(x)
     return out
 
+# Dependency masks: each register, flag and pseudo-register below is one bit of an int.
+# '[HL]' is the indirect store written by LDI/LDD in the opcode table.
+REG_NAMES = ('A', 'B', 'C', 'D', 'E', 'H', 'L', 'SP', 'FZ', 'FC', 'FN', 'FH', 'mem', 'ROMBANK', 'IME', 'sideeffects', '[HL]')
+
+_masks = dict((name, 1 << i) for i, name in enumerate(REG_NAMES))
+for _name in ('BC', 'DE', 'HL', 'AF', 'FNZ', 'FNC', 'FF00+C'):
+    _masks[_name] = sum(_masks[x] for x in splitRegister(_name))
+
+_names = dict()
+
+def isRegister(name):
+    """True if name has bits in a dependency mask. Other dependencies are memory addresses."""
+    return name in _masks
+
+def registerMask(names):
+    """Mask of the registers in names. Names without bits (memory addresses) are skipped."""
+    out = 0
+    for x in names:
+        if x in _masks:
+            out |= _masks[x]
+    return out
+
+def maskNames(mask):
+    """Register names of the bits in mask."""
+    try:
+        return _names[mask]
+    except KeyError:
+        out = frozenset(name for name in REG_NAMES if _masks[name] & mask)
+        _names[mask] = out
+        return out
+
+ALL_REGS_MASK = registerMask(ALL_REGS)
+FLAGS_MASK = registerMask(['FZ', 'FC', 'FN', 'FH'])
+MEM_MASK = registerMask(['mem'])
+
 def joinRegisters(regs):
     out = set(regs)
     for big in ('BC', 'DE', 'HL'):
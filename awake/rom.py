@@ -14,27 +14,72 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
+import mmap
 import struct
+from awake.address import BadAddressException
+
+_byte = struct.Struct('B').unpack_from
+_word = struct.Struct('<H').unpack_from
+
+try:
+    _view = buffer
+except NameError:  # Python 3
+    def _view(data, offset, size):
+        return memoryview(data)[offset:offset+size]
 
 class Rom(object):
     def __init__(self, filename):
         self.filename = filename
         with open(filename, 'rb') as f:
-            self.data = f.read()
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty files cannot be mapped
+                self.data = b''
+        self._hash = None
+
+    def close(self):
+        if hasattr(self.data, 'close'):
+            self.data.close()
+
+    def size(self):
+        return len(self.data)
+
+    def hash(self):
+        """Hex SHA-1 of the ROM contents."""
+        if self._hash is None:
+            self._hash = hashlib.sha1(self.data).hexdigest()
+        return self._hash
+
+    def _physicalRange(self, addr, length):
+        """Physical offset of a run of bytes, which must not leave the memory region of addr."""
+        start = addr.physical()
+        if addr.virtual() < 0x4000:
+            region_end = 0x4000
+        else:
+            region_end = 0x8000
+        if addr.virtual() + length > region_end:
+            raise BadAddressException(addr.offset(length - 1))
+        return start
+
+    def byteAt(self, physical):
+        return _byte(self.data, physical)[0]
 
     def get(self, addr):
-        return struct.unpack('B', self.data[addr.physical()])[0]
+        return _byte(self.data, addr.physical())[0]
 
     def get_word(self, addr):
-        lo = self.get(addr)
-        hi = self.get(addr.offset(1))
-        return (hi << 8) | lo
+        return _word(self.data, self._physicalRange(addr, 2))[0]
+
+    def read_range(self, addr, length):
+        """Zero-copy view of length bytes starting at addr."""
+        start = self._physicalRange(addr, length)
+        if start + length > len(self.data):
+            raise IndexError(addr)
+        return _view(self.data, start, length)
 
     def read(self, addr, length):
-        out = []
-        for i in range(length):
-            out.append(self.get(addr.offset(i)))
-        return out
+        return list(bytearray(self.read_range(addr, length)))
 
     def numBanks(self):
         num = len(self.data) / 0x4000
@@ -109,9 +109,12 @@ class Handler(BaseHTTPRequestHandler):
 
 class StoppableHTTPServer(HTTPServer):
     def serve_forever(self):
+        # wake up regularly while idle, so queued database writes do not wait for the next request
+        self.timeout = self.proj.database.flush_interval
         self.request_stop = False
         while not self.request_stop:
             self.handle_request()
+            self.proj.database.flushIfDue()
 
 class ServerTask(AsyncTask):
     def __init__(self, proj, port=8888):
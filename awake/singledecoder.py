@@ -20,11 +20,16 @@ from awake.opcodeeffect import OpcodeEffect
 from awake.operand import Constant
 from awake.context import Context
 from awake.expression import parse
+from awake.regutil import registerMask
 
-def fillOperand(text, params, argument, next_addr):
-    e = parse(text)
-    ctx = make_context(params, argument, next_addr)
-    return e.optimizedWithContext(ctx)
+ARGUMENTS = frozenset(['v8', 'v16', 'v8_rel', 'FF00_v8'])
+
+def make_param_context(params):
+    ctx = Context()
+    for p in params:
+        value = placeholders.get(p, params[p])
+        ctx.setValue('#'+p, value)
+    return ctx
 
 def make_context(params, argument, next_addr):
     ctx = Context()
@@ -42,6 +47,58 @@ def make_context(params, argument, next_addr):
         ctx.setValue('#'+p, value)
     return ctx
 
+class ExpressionTemplate(object):
+    """Parsed operand or effect value. Expressions without immediate arguments are optimized once, up front."""
+
+    def __init__(self, expr, params):
+        self.expr = expr
+        self.static = not (expr.getDependencies() & ARGUMENTS)
+        if self.static:
+            self.expr = expr.optimizedWithContext(make_param_context(params))
+
+    def filled(self, ctx):
+        if self.static:
+            return self.expr
+        return self.expr.optimizedWithContext(ctx)
+
+class OpcodeRecord(object):
+    """Everything about a single opcode byte that does not depend on its argument bytes."""
+
+    def __init__(self, decoder, opcode):
+        self.name = decoder.name
+        self.argSize = decoder.argSize
+        self.length = decoder.length()
+        self.params = decoder.matchBits(opcode)
+        self.operands = [ExpressionTemplate(parse(text), self.params) for text in decoder.operands]
+        reads, writes, loads = decoder.effect.template(self.params)
+        self.reads = registerMask(reads)
+        self.writes = registerMask(writes)
+        self.loads = [(name, ExpressionTemplate(e, self.params)) for name, e in loads]
+        self.static = all(x.static for x in self.operands) and all(x.static for _, x in self.loads)
+
+    def decode(self, proj, opcodes, addr):
+        argument = 0
+        if self.argSize == 1:
+            argument = opcodes[1]
+        elif self.argSize == 2:
+            argument = (opcodes[2] << 8) | opcodes[1];
+
+        next_addr = addr.offset(self.length)
+
+        ctx = None
+        if not self.static:
+            ctx = make_context(self.params, argument, next_addr)
+
+        out_operands = [x.filled(ctx) for x in self.operands]
+
+        values = dict()
+        loads = []
+        for name, x in self.loads:
+            values[name] = x.filled(ctx)
+            loads.append((name, values[name]))
+
+        return instruction.make(proj, self.name, out_operands, addr, self.reads, self.writes, values, loads), next_addr
+
 class SingleOpcodeDecoder(object):
     def __init__(self, text):
 
@@ -95,24 +152,9 @@ class SingleOpcodeDecoder(object):
     def length(self):
         return 1 + self.argSize
 
+    def compiled(self, opcode):
+        return OpcodeRecord(self, opcode)
+
     def decode(self, proj, opcodes, addr):
         assert len(opcodes) == self.length()
-
-        params = self.matchBits(opcodes[0])
-
-        argument = 0
-        if self.argSize == 1:
-            argument = opcodes[1]
-        elif self.argSize == 2:
-            argument = (opcodes[2] << 8) | opcodes[1];
-
-        next_addr = addr.offset(self.length())
-
-        out_operands = [
-            fillOperand(text, params, argument, next_addr) for text in self.operands
-        ]
-
-        reads, writes, values, loads = self.effect.filled(params, make_context(params, argument, next_addr))
-
-        return instruction.make(proj, self.name, out_operands, addr, reads, writes, values, loads), next_addr
-
+        return self.compiled(opcodes[0]).decode(proj, opcodes, addr)
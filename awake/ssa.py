@@ -0,0 +1,283 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from collections import defaultdict
+from awake.context import Context
+from awake.regutil import FLAGS_MASK, MEM_MASK, maskNames, registerMask
+
+# registers whose values are propagated
+REGS = ('A', 'B', 'C', 'D', 'E', 'H', 'L', 'SP', 'FZ', 'FC', 'FN', 'FH', 'ROMBANK')
+REGS_SET = frozenset(REGS)
+A_MASK = registerMask(['A'])
+ROMBANK_MASK = registerMask(['ROMBANK'])
+
+# lattice of SSA values: TOP (no path seen yet), a constant operand, or BOTTOM (not constant)
+TOP = 'top'
+BOTTOM = 'bottom'
+
+def meet(a, b):
+    if a is TOP:
+        return b
+    if b is TOP or a is BOTTOM:
+        return a
+    if b is BOTTOM or not a == b:
+        return BOTTOM
+    return a
+
+def reversePostorder(graph):
+    from awake.flow import dfs_postorder
+    return [x for x in reversed(dfs_postorder(graph)) if x is not None]
+
+def dominators(graph, order):
+    """Immediate dominators of the vertices in order, which must be a reverse postorder (Cooper, Harvey, Kennedy)."""
+    index = dict((x, i) for i, x in enumerate(order))
+    start = order[0]
+    idom = {start: start}
+
+    def intersect(a, b):
+        while a != b:
+            while index[a] > index[b]:
+                a = idom[a]
+            while index[b] > index[a]:
+                b = idom[b]
+        return a
+
+    offsets, pred = graph.predecessors()
+    changed = True
+    while changed:
+        changed = False
+        for x in order[1:]:
+            new = None
+            for i in xrange(offsets[x], offsets[x+1]):
+                p = pred[i]
+                if p not in idom:
+                    continue
+                if new is None:
+                    new = p
+                else:
+                    new = intersect(p, new)
+            if idom.get(x) != new:
+                idom[x] = new
+                changed = True
+    return idom
+
+def dominanceFrontiers(graph, order, idom):
+    offsets, pred = graph.predecessors()
+    start = order[0]
+    frontiers = dict((x, set()) for x in order)
+    for x in order:
+        preds = [p for p in pred[offsets[x]:offsets[x+1]] if p in idom]
+        # the start has an extra edge from the procedure entry
+        if len(preds) < 2 and not (x == start and preds):
+            continue
+        stop = idom[x] if x != start else None
+        for p in preds:
+            runner = p
+            while runner != stop:
+                frontiers[runner].add(x)
+                runner = idom[runner] if runner != start else None
+    return frontiers
+
+class ConstantPropagation(object):
+    """
+    Sparse conditional constant propagation on an SSA form of a ProcedureGraph.
+
+    SSA is built on whole blocks: phis are placed at the iterated dominance frontiers of the
+    blocks writing a register, each block defines one value for every register it writes and
+    reads the definitions reaching its entry. A block is evaluated by running its instructions
+    on a Context holding the constants that reach it. Only the blocks and phis using a changed
+    definition are evaluated again, and only along edges the constant branch conditions allow.
+
+    constantsAt(x) gives the register constants known on entry to block x.
+    """
+
+    def __init__(self, graph, ctx):
+        self.graph = graph
+        self.order = reversePostorder(graph)
+        self.idom = dominators(graph, self.order)
+
+        self.writes = dict((x, self.blockWrites(x)) for x in self.order)
+        self.placePhis()
+        self.rename(ctx)
+        self.propagate()
+
+    def blockWrites(self, x):
+        """
+        Registers x may change. Extra registers only cost phis, as evaluation passes unchanged
+        values through. Stores and calls can switch ROMBANK, loading AF sets the flags.
+        """
+        writes = 0
+        for instr in self.graph.getContents(x):
+            writes |= instr.getDependencySet().writes
+            if hasattr(instr, 'target_depset'):
+                writes |= ROMBANK_MASK
+        if writes & MEM_MASK:
+            writes |= ROMBANK_MASK
+        if writes & A_MASK:
+            writes |= FLAGS_MASK
+        return maskNames(writes) & REGS_SET
+
+    def placePhis(self):
+        frontiers = dominanceFrontiers(self.graph, self.order, self.idom)
+        self.phis = defaultdict(list)
+        for r in REGS:
+            work = [x for x in self.order if r in self.writes[x]]
+            seen = set(work)
+            placed = set()
+            while work:
+                x = work.pop()
+                for y in frontiers[x]:
+                    if y not in placed:
+                        placed.add(y)
+                        self.phis[y].append(r)
+                        if y not in seen:
+                            seen.add(y)
+                            work.append(y)
+
+    def newDef(self, value=TOP):
+        self.values.append(value)
+        self.block_users.append([])
+        self.phi_users.append([])
+        return len(self.values) - 1
+
+    def rename(self, ctx):
+        self.values = []
+        self.block_users = []
+        self.phi_users = []
+
+        entry = dict()
+        for r in REGS:
+            entry[r] = self.newDef(ctx.getValue(r) if ctx.hasConstantValue(r) else BOTTOM)
+
+        start = self.order[0]
+        self.phi_def = dict()
+        self.phi_args = dict()
+        self.reaching = dict()
+        self.block_out = dict()
+        for x in self.order:
+            if x == start:
+                cur = dict(entry)
+            else:
+                cur = dict(self.block_out[self.idom[x]])
+            for r in self.phis[x]:
+                cur[r] = self.phi_def[x, r] = self.newDef()
+                self.phi_args[x, r] = []
+                if x == start:
+                    self.phi_args[x, r].append((None, entry[r]))
+            self.reaching[x] = cur
+            for d in set(cur.values()):
+                self.block_users[d].append(x)
+
+            out = dict(cur)
+            for r in self.writes[x]:
+                out[r] = self.newDef()
+            self.block_out[x] = out
+
+        offsets, succ = self.graph.successors()
+        for x in self.order:
+            for i in xrange(offsets[x], offsets[x+1]):
+                ch = succ[i]
+                if ch == self.graph.EXIT:
+                    continue
+                for r in self.phis[ch]:
+                    d = self.block_out[x][r]
+                    self.phi_args[ch, r].append((x, d))
+                    self.phi_users[d].append((ch, r))
+
+    def lower(self, d, value):
+        new = meet(self.values[d], value)
+        if new is not self.values[d]:
+            self.values[d] = new
+            self._changed.append(d)
+
+    def propagate(self):
+        self.executable = set()
+        self.edges = set()
+        self._changed = []
+        self._queued = set()
+        self._blocks = []
+
+        start = self.order[0]
+        self.executable.add(start)
+        for r in self.phis[start]:
+            self.evalPhi(start, r)
+        self.schedule(start)
+
+        while self._blocks or self._changed:
+            while self._changed:
+                d = self._changed.pop()
+                for x, r in self.phi_users[d]:
+                    self.evalPhi(x, r)
+                for x in self.block_users[d]:
+                    if x in self.executable:
+                        self.schedule(x)
+            if self._blocks:
+                x = self._blocks.pop()
+                self._queued.discard(x)
+                self.evalBlock(x)
+
+    def schedule(self, x):
+        if x not in self._queued:
+            self._queued.add(x)
+            self._blocks.append(x)
+
+    def evalPhi(self, x, r):
+        value = TOP
+        for p, d in self.phi_args[x, r]:
+            if p is None or (p, x) in self.edges:
+                value = meet(value, self.values[d])
+        self.lower(self.phi_def[x, r], value)
+
+    def evalBlock(self, x):
+        ctx = Context(self.constantsAt(x))
+        contents = self.graph.getContents(x)
+        for instr in contents:
+            instr.updateContext(ctx)
+
+        for r in self.writes[x]:
+            self.lower(self.block_out[x][r], ctx.getValue(r) if ctx.hasConstantValue(r) else BOTTOM)
+
+        # conditional jump or return, the taken branch is the second child
+        offsets, succ = self.graph.successors()
+        lo, hi = offsets[x], offsets[x+1]
+        if hi - lo == 2 and hasattr(contents[-1], 'cond'):
+            cond = contents[-1].cond.optimizedWithContext(ctx)
+            if cond.value in (0, 1):
+                lo += cond.value
+                hi = lo + 1
+
+        for i in xrange(lo, hi):
+            ch = succ[i]
+            if ch == self.graph.EXIT or (x, ch) in self.edges:
+                continue
+            self.edges.add((x, ch))
+            for r in self.phis[ch]:
+                self.evalPhi(ch, r)
+            if ch not in self.executable:
+                self.executable.add(ch)
+                self.schedule(ch)
+
+    def constantsAt(self, x):
+        """Register values known to be constant on entry to block x."""
+        if x not in self.executable:
+            return dict()
+        out = dict()
+        for r, d in self.reaching[x].items():
+            value = self.values[d]
+            if value is not TOP and value is not BOTTOM:
+                out[r] = value
+        return out
@@ -0,0 +1,143 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from .database import Database
+from . import address
+
+
+class Test(unittest.TestCase):
+
+    def testBatchedSave(self):
+        db = Database(':memory:')
+        a = address.fromConventional("0001:4000")
+        b = address.fromConventional("0001:4100")
+
+        info = db.procInfo(a)
+        info.calls = set([b])
+        info.memreads = set([address.fromConventional("WORK:C000")])
+        info.length = 10
+        db.saveProcInfo(info)
+        db.reportProc(b)
+
+        self.assertEquals(len(db.pending), 2)
+        self.assertEquals(db.procInfo(a).length, 10)
+        self.assertEquals(db.procInfo(b).callers, set([a]))
+
+        self.assertEquals(db.getAllInBank(1), [a, b])
+        self.assertFalse(db.pending)
+        self.assertEquals(db.procInfo(b).callers, set([a]))
+        self.assertEquals(db.getDataReferers(address.fromConventional("WORK:C000")), (set([a]), set()))
+
+        info = db.procInfo(a)
+        info.calls = set()
+        db.saveProcInfo(info)
+        self.assertEquals(db.procInfo(b).callers, set())
+        db.close()
+
+    def testLoadProcInfos(self):
+        db = Database(':memory:')
+        a = address.fromConventional("0001:4000")
+        b = address.fromConventional("0002:4000")
+        c = address.fromConventional("0001:4100")
+
+        info = db.procInfo(a)
+        info.calls = set([b])
+        info.tail_calls = set([c])
+        info.memwrites = set([address.fromConventional("HRAM:FF80")])
+        db.saveProcInfo(info)
+        db.reportProc(b)
+        db.reportProc(c)
+
+        infos = db.loadProcInfos()
+        self.assertEquals(sorted(infos), [a, c, b])
+        for addr in infos:
+            expected = db.procInfo(addr)
+            for attr in ('calls', 'tail_calls', 'memreads', 'memwrites', 'callers', 'length'):
+                self.assertEquals(getattr(infos[addr], attr), getattr(expected, attr))
+
+        infos = db.loadProcInfos(1)
+        self.assertEquals(sorted(infos), [a, c])
+        self.assertEquals(infos[c].callers, set([a]))
+
+        db.preloadProcInfos()
+        self.assertEquals(db.preloaded, None)
+        self.assertEquals(db.procInfo(b).callers, set([a]))
+        self.assertIn(c, db.preloaded)
+        db.saveProcInfo(db.procInfo(c))
+        self.assertEquals(db.preloaded, None)
+        self.assertEquals(db.procInfo(b).callers, set([a]))
+        self.assertEquals(db.preloaded, None)
+        db.close()
+
+    def testSymbols(self):
+        db = Database(':memory:')
+        addr = address.fromConventional("0001:4000")
+        self.assertEquals(db.nameForAddress(addr), "0001:4000")
+        self.assertFalse(db.hasNameForAddress(addr))
+        self.assertEquals(db.nameForAddress(address.fromConventional("IO:FF40")), "IO:LCDC")
+
+        version = db.symbols_version
+        db.setNameForAddress(addr, "init")
+        self.assertEquals(db.nameForAddress(addr), "init")
+        self.assertTrue(db.hasNameForAddress(addr))
+        self.assertTrue(db.symbols_version > version)
+
+        db.setNameForAddress(address.fromConventional("IO:FF40"), "lcdc")
+        self.assertEquals(db.nameForAddress(address.fromConventional("IO:FF40")), "IO:LCDC")
+
+        db.symbols = dict()
+        db.loadSymbols()
+        self.assertEquals(db.nameForAddress(addr), "init")
+        db.close()
+
+    def testCopies(self):
+        db = Database(':memory:')
+        db.flush_interval = 60
+        a = address.fromConventional("0001:4000")
+        b = address.fromConventional("0001:4100")
+
+        info = db.procInfo(a)
+        info.calls = set([b])
+        db.saveProcInfo(info)
+        depset = info.depset
+        info.calls.add(a)
+        info.length = 10
+        self.assertTrue(info.depset is depset)
+
+        queued = db.procInfo(a)
+        self.assertEquals(queued.calls, set([b]))
+        self.assertEquals(queued.length, 0)
+        queued.calls.clear()
+        self.assertEquals(db.procInfo(a).calls, set([b]))
+        self.assertEquals(db.procInfo(b).callers, set([a]))
+
+        db.preloadProcInfos()
+        db.procInfo(b).callers.clear()
+        self.assertEquals(db.procInfo(b).callers, set([a]))
+        db.close()
+
+    def testFlushInterval(self):
+        db = Database(':memory:')
+        db.flush_interval = 60
+        db.reportProc(address.fromConventional("0001:4000"))
+        self.assertTrue(db.pending)
+
+        # any later access writes the queue once the interval has passed
+        db.last_flush -= 60
+        db.procInfo(address.fromConventional("0001:4100"))
+        self.assertFalse(db.pending)
+        db.close()
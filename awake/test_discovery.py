@@ -0,0 +1,122 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from .depend import dependencySetFromNames, encodeDependencySet
+from .discovery import callGraphComponents, callGraphSchedule, discover
+from .parallel import discoverParallel
+from .project import Project
+from . import address
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def testComponents(self):
+        # 1 and 2 call each other, 3 calls itself
+        graph = {0: set([1, 3]), 1: set([2]), 2: set([1, 4]), 3: set([3, 4])}
+        components = [sorted(c) for c in callGraphComponents(graph)]
+        self.assertEquals(sorted(components), [[0], [1, 2], [3], [4]])
+        self.assertEquals(components[0], [4])
+        self.assertEquals(components[-1], [0])
+
+    def testSchedule(self):
+        graph = {0: set([1, 3]), 1: set([2]), 2: set([1, 4]), 3: set([3, 4])}
+        order = callGraphSchedule(graph)
+        waves = dict((x, order[x][0]) for x in order)
+        self.assertEquals(waves, {4: 0, 1: 1, 2: 1, 3: 1, 0: 2})
+        self.assertEquals(order[1][1], order[2][1])
+
+    def testLongChain(self):
+        graph = dict((i, set([i + 1])) for i in range(5000))
+        self.assertEquals(callGraphSchedule(graph)[0][0], 5000)
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        data = bytearray(0x8000)
+        for vector in (0x40, 0x48, 0x50, 0x58, 0x60):
+            data[vector] = 0xD9  # RETI
+        data[0x0100:0x0107] = bytearray([0xCD, 0x00, 0x02, 0xEA, 0x00, 0xC0, 0xC9])  # CALL 0200; LD (C000), A; RET
+        data[0x0200:0x0203] = bytearray([0x3E, 0x12, 0xC9])  # LD A, 12; RET
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'test.gb')
+        with open(self.filename, 'wb') as f:
+            f.write(data)
+        self.proj = Project(self.filename, None)
+
+    def tearDown(self):
+        self.proj.close()
+        shutil.rmtree(self.path)
+
+    def testFixpoint(self):
+        self.checkFixpoint(discover(self.proj))
+
+    def testParallel(self):
+        self.checkFixpoint(discoverParallel(self.proj, jobs=2))
+
+    def checkFixpoint(self, stats):
+        self.assertTrue(stats.converged)
+        self.assertEquals(stats.discovered, 1)
+        self.assertEquals(stats.failed, 0)
+
+        database = self.proj.database
+        callee = address.fromVirtual(0x200)
+        self.assertIn(callee, database.getAll())
+        self.assertIn('A', database.procInfo(callee).depset.writeNames())
+
+        # analysing any proc again does not change its dependency set
+        for addr in database.getAll():
+            deps = encodeDependencySet(database.procInfo(addr).depset)
+            self.proj.flow.refresh(addr)
+            self.assertEquals(encodeDependencySet(database.procInfo(addr).depset), deps)
+
+    def testInvalidateChangedCalls(self):
+        disasm = self.proj.disasm
+        database = self.proj.database
+        caller = address.fromVirtual(0x100)
+        disasm.decodeCache(caller)
+        disasm.invalidateChangedCalls(database.getEncodedDepsets(disasm.call_sites))
+        self.assertIn(caller, disasm.cache)
+
+        # a save this process was not told about, like those of the writer seen by a worker
+        info = database.procInfo(address.fromVirtual(0x200))
+        info.depset = dependencySetFromNames([], ['A'])
+        database.saveProcInfo(info)
+        disasm.invalidateChangedCalls(database.getEncodedDepsets(disasm.call_sites))
+        self.assertNotIn(caller, disasm.cache)
+
+    def testFlowCacheDependents(self):
+        flow = self.proj.flow
+        flow.max_size = 0  # only the last proc stays cached
+        caller = address.fromVirtual(0x100)
+        callee = address.fromVirtual(0x200)
+        flow.at(callee)
+        flow.at(caller)
+        self.assertEquals(flow.dependents[callee], set([caller]))
+
+        # evicting the caller forgets that it depends on the callee
+        flow.at(address.fromVirtual(0x40))
+        self.assertNotIn(caller, flow.cache)
+        self.assertNotIn(callee, flow.dependents)
+
+    def testMaxSteps(self):
+        stats = discover(self.proj, max_steps=2)
+        self.assertFalse(stats.converged)
+        self.assertEquals(stats.analyses, 2)
@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import cPickle as pickle
 import unittest
 from . import operand
 from . import operator
@@ -39,5 +40,42 @@ class Test(unittest.TestCase):
         e = e.optimizedWithContext(context.Context())
         self.assertEquals(str(e), "(A << 2) & 0xc0")
 
+    def testInterned(self):
+        a = operator.HighByte(operand.Register('HL'))
+        b = operator.HighByte(operand.Register('HL'))
+        self.assertTrue(a is b)
+        self.assertTrue(operator.Add(operand.Register('A'), operand.Constant(1)) is expression.parse("A+1"))
+        self.assertFalse(operand.ComplexValue() is operand.ComplexValue())
+
+    def testInternedArguments(self):
+        # the constants are freed once the dereferences are built, their ids can come back
+        derefs = [operand.Dereference(operand.Constant(x)) for x in range(0xC000, 0xC010)]
+        self.assertEquals([str(x) for x in derefs], ['[WORK:{0:04X}]'.format(x) for x in range(0xC000, 0xC010)])
+
+    def testCachedOptimize(self):
+        e = expression.parse("(A+B)&C")
+        ctx = context.Context()
+        ctx.setValue('A', operand.Constant(1))
+        first = e.optimizedWithContext(ctx)
+        self.assertTrue(e.optimizedWithContext(ctx) is first)
+        self.assertTrue(e.optimizedWithContext(ctx.clone()) is first)
+        ctx.setValue('B', operand.Constant(2))
+        self.assertEquals(str(e.optimizedWithContext(ctx)), "C & 3")
+        self.assertEquals(str(e.optimizedWithContext(context.Context())), "(A + B) & C")
+
+    def testPickledCache(self):
+        e = operand.Dereference(operand.Register('HL'))
+        ctx = context.Context()
+        ctx.setValue('HL', operand.Constant(0xC000))
+        self.assertEquals(str(e.optimizedWithContext(ctx)), "[WORK:C000]")
+        loaded = pickle.loads(pickle.dumps(e, pickle.HIGHEST_PROTOCOL))
+
+        # context versions start over in another process
+        other = context.Context()
+        other.setValue('HL', operand.Constant(0xD000))
+        other.version = ctx.version
+        self.assertEquals(str(loaded.optimizedWithContext(other)), "[WORK:D000]")
+        self.assertEquals(str(pickle.loads(pickle.dumps(e))), "[HL]")
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,73 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from .flow import find_cycles, find_merge_points
+from .flowcontrol import Block
+from .procedure import ProcedureGraph
+
+EXIT = ProcedureGraph.EXIT
+
+
+def makeGraph(childs):
+    g = ProcedureGraph.__new__(ProcedureGraph)
+    g.blocks = [Block([]) for x in childs]
+    g._edges = [[EXIT if ch is None else ch for ch in childs[x]] for x in sorted(childs)]
+    g._buildEdges()
+    return g
+
+
+class Test(unittest.TestCase):
+
+    def testDiamond(self):
+        g = makeGraph({0: [1, 2], 1: [3], 2: [3], 3: [None]})
+        self.assertEquals(find_merge_points(g), {0: set([3])})
+
+    def testEarlyReturn(self):
+        g = makeGraph({0: [1, None], 1: [2], 2: [None]})
+        self.assertEquals(dict(find_merge_points(g)), {})
+
+    def testTwoFrontiers(self):
+        g = makeGraph({0: [1, 2], 1: [3], 2: [3, 4], 3: [4], 4: [None]})
+        self.assertEquals(find_merge_points(g), {0: set([3, 4]), 2: set([4])})
+
+    def testSwitch(self):
+        # three of four cases meet, the last one returns
+        g = makeGraph({0: [1, 2, 3, 4], 1: [5], 2: [5], 3: [5], 4: [None], 5: [None]})
+        self.assertEquals(find_merge_points(g), {0: set([5])})
+
+    def testLoop(self):
+        g = makeGraph({0: [1], 1: [2, 3], 2: [1], 3: [None]})
+        self.assertEquals(dict(find_merge_points(g)), {})
+
+    def testNestedCycles(self):
+        g = makeGraph({0: [1], 1: [2, 4], 2: [3, 1], 3: [2], 4: [None]})
+        cycles = find_cycles(g)
+        members = lambda x: sorted(sorted(c) for c in cycles[x])
+        self.assertEquals(members(1), [[1, 2, 3]])
+        self.assertEquals(members(2), [[1, 2, 3], [2, 3]])
+        self.assertEquals(members(3), [[1, 2, 3], [2, 3]])
+        self.assertEquals(members(4), [])
+
+    def testLongLoop(self):
+        n = 5000
+        childs = dict((i, [i + 1]) for i in range(n))
+        childs[n] = [1, None]
+        g = makeGraph(childs)
+        cycles = find_cycles(g)
+        self.assertEquals(len(cycles[n]), 1)
+        self.assertEquals(len(list(cycles[n])[0]), n)
+        self.assertEquals(dict(find_merge_points(g)), {})
@@ -0,0 +1,141 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from .database import Database
+from .depend import dependencySetFromNames, encodeDependencySet
+from .flowstore import FlowStore
+from . import address, flowstore
+
+
+class FakeRom(object):
+    def hash(self):
+        return 'f00d'
+
+class FakeProject(object):
+    def __init__(self):
+        self.rom = FakeRom()
+        self.database = Database(':memory:')
+
+class FakeFlow(object):
+    def __init__(self, addr, runs, callee_deps):
+        self.addr = addr
+        self.owned_runs = runs
+        self.callee_deps = callee_deps
+
+# store of the test running the workers, inherited when they fork
+_shared_store = None
+
+def _saveInWorker(i):
+    addr = address.fromVirtual(0x4000 + i)
+    # every worker checks for the directory before any of them creates it
+    os.path.isdir = lambda path: False
+    try:
+        _shared_store.save(FakeFlow(addr, [(addr, 1, 1)], {}))
+    except Exception as e:
+        return repr(e)
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testStore(self):
+        proj = FakeProject()
+        store = FlowStore(proj, self.path)
+        addr = address.fromConventional("0001:4000")
+        callee = address.fromConventional("0001:4100")
+        runs = [(addr, 16, 1)]
+
+        info = proj.database.procInfo(callee)
+        info.depset = dependencySetFromNames(['A'], ['HL'])
+        proj.database.saveProcInfo(info)
+
+        store.save(FakeFlow(addr, runs, {callee: encodeDependencySet(info.depset)}))
+        self.assertEquals(store.load(addr, runs).callee_deps.keys(), [callee])
+        self.assertEquals(store.load(addr, [(addr, 17, 1)]), None)
+
+        info.depset = dependencySetFromNames(['A', 'B'], ['HL'])
+        proj.database.saveProcInfo(info)
+        self.assertEquals(store.load(addr, runs), None)
+
+    def testConcurrentSave(self):
+        global _shared_store
+        store = FlowStore(FakeProject(), os.path.join(self.path, 'new'))
+        _shared_store = store
+        pool = multiprocessing.Pool(4)
+        try:
+            errors = pool.map(_saveInWorker, range(32))
+        finally:
+            pool.close()
+            pool.join()
+        _shared_store = None
+        self.assertEquals(errors, [None] * 32)
+        self.assertEquals(len(os.listdir(store.path)), 32)
+
+    def testCodeVersion(self):
+        proj = FakeProject()
+        addr = address.fromConventional("0001:4000")
+        runs = [(addr, 16, 1)]
+        FlowStore(proj, self.path).save(FakeFlow(addr, runs, {}))
+        self.assertNotEquals(FlowStore(proj, self.path).load(addr, runs), None)
+
+        # entries pickled by other code are not used
+        version = flowstore._code_version
+        flowstore._code_version = 'other'
+        try:
+            self.assertEquals(FlowStore(proj, self.path).load(addr, runs), None)
+        finally:
+            flowstore._code_version = version
+
+    def testPrune(self):
+        for name in ['f00d-other', 'f00d-other-constants', 'beef-other']:
+            os.mkdir(os.path.join(self.path, name))
+        store = FlowStore(FakeProject(), self.path, 'constants')
+        os.mkdir(store.path)
+        FlowStore(FakeProject(), self.path)
+        self.assertEquals(sorted(os.listdir(self.path)), sorted(['beef-other', os.path.basename(store.path)]))
+
+        # a proc saved with other runs replaces its old entry
+        addr = address.fromConventional("0001:4000")
+        store.save(FakeFlow(addr, [(addr, 16, 1)], {}))
+        store.save(FakeFlow(addr, [(addr, 17, 1)], {}))
+        self.assertEquals(os.listdir(store.path), [os.path.basename(store.filename(addr, [(addr, 17, 1)]))])
+
+    def testSaveFailure(self):
+        addr = address.fromConventional("0001:4000")
+        runs = [(addr, 16, 1)]
+
+        # unpicklable flow
+        store = FlowStore(FakeProject(), self.path)
+        flow = FakeFlow(addr, runs, {})
+        flow.callback = lambda: None
+        store.save(flow)
+        self.assertEquals(os.listdir(store.path), [])
+
+        # store directory cannot be created
+        open(os.path.join(self.path, 'file'), 'w').close()
+        store = FlowStore(FakeProject(), os.path.join(self.path, 'file'))
+        store.save(FakeFlow(addr, runs, {}))
+        self.assertEquals(store.load(addr, runs), None)
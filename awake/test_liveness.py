@@ -0,0 +1,76 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+from .flowcontrol import Block
+from .instruction import LoadInstruction
+from .liveness import Liveness
+from .operand import Constant, Register
+from .procedure import ProcedureGraph
+from .regutil import registerMask
+from . import address
+
+EXIT = ProcedureGraph.EXIT
+
+
+def load(addr, target, source):
+    if isinstance(source, int):
+        source = Constant(source)
+    else:
+        source = Register(source)
+    return LoadInstruction('LD', Register(target), source, address.fromVirtual(addr))
+
+
+def makeGraph(blocks, edges):
+    g = ProcedureGraph.__new__(ProcedureGraph)
+    g.blocks = [Block(x) for x in blocks]
+    g.block_offsets = [x[0].addr.virtual() for x in blocks]
+    g._edges = edges
+    g._buildEdges()
+    return g
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.b1 = load(0x100, 'B', 1)
+        self.c2 = load(0x102, 'C', 2)
+        self.h3 = load(0x104, 'H', 3)
+        self.ab = load(0x110, 'A', 'B')
+        self.d5 = load(0x111, 'D', 5)
+        self.lh = load(0x113, 'L', 'H')
+        self.da = load(0x120, 'D', 'A')
+        blocks = [[self.b1, self.c2, self.h3], [self.ab, self.d5, self.lh], [self.da]]
+        # block 1 loops on itself
+        self.graph = makeGraph(blocks, [[1], [1, 2], [EXIT]])
+        self.content = Block(sum(blocks, []))
+
+    def testLoop(self):
+        live = Liveness(self.graph, self.content, dict(), registerMask(['A', 'D']))
+        # D is overwritten on exit from the loop, C and L are never read
+        self.assertEquals(live.dead, set([self.c2, self.d5, self.lh, self.h3]))
+        self.assertEquals(live.live_in[1], registerMask(['B']))
+        self.assertEquals(live.live_out[1], registerMask(['A', 'B']))
+        self.assertEquals(live.live_in[0], 0)
+
+    def testWithoutDead(self):
+        live = Liveness(self.graph, self.content, dict(), registerMask(['A', 'D']))
+        content = self.content.withoutDead(live.dead)
+        self.assertEquals(content.contents, [self.b1, self.ab, self.da])
+
+    def testUnchangedShared(self):
+        self.assertIs(self.content.withoutDead(set()), self.content)
@@ -0,0 +1,45 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import cPickle as pickle
+import unittest
+from awake import address
+from awake.instruction import LoadInstruction
+from awake.memory import footprint
+from awake.operand import Constant, Dereference, Register
+from awake.operator import Add
+
+
+class Test(unittest.TestCase):
+
+    def testSlots(self):
+        value = Add(Register('A'), Constant(1))
+        instr = LoadInstruction('LD', Dereference(Register('HL')), value, address.fromVirtual(0x150))
+        for x in (value, value.left, value.right, instr, instr.target, instr.addr):
+            self.assertFalse(hasattr(x, '__dict__'))
+        self.assertIs(Add(Register('A'), Constant(1)), value)
+
+    def testPickle(self):
+        instr = LoadInstruction('LD', Register('B'), Add(Register('A'), Constant(1)), address.fromVirtual(0x150))
+        copy = pickle.loads(pickle.dumps(instr, pickle.HIGHEST_PROTOCOL))
+        self.assertEquals(str(copy), str(instr))
+        self.assertEquals(copy.addr, instr.addr)
+        self.assertEquals(copy.getDependencySet().readNames(), instr.getDependencySet().readNames())
+
+    def testFootprint(self):
+        shared = [Register('A')] * 100
+        self.assertEquals(footprint([shared, shared]), footprint([shared]))
+        self.assertGreater(footprint([shared]), footprint([shared], skip=[Register('A')]))
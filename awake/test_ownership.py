@@ -0,0 +1,85 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from .ownership import CODE, JUMPTABLE, OwnedBytes, OwnershipMap
+from . import address
+
+
+class Test(unittest.TestCase):
+
+    def testOwnedBytes(self):
+        start = address.fromConventional("0003:7000")
+        owned = OwnedBytes(start, address.fromConventional("0004:4000"))
+        self.assertEquals(len(owned.bits), 0x1000)
+        self.assertEquals(owned.firstClear(start), start)
+
+        owned.addRange(start, 3)
+        owned.add(start.offset(4))
+        self.assertTrue(start.offset(2) in owned)
+        self.assertFalse(start.offset(3) in owned)
+        self.assertFalse(address.fromVirtual(0x7002) in owned)
+        self.assertEquals(len(owned), 4)
+        self.assertEquals(owned.firstClear(start), start.offset(3))
+        self.assertTrue(owned.isClear(start.offset(3), 1))
+        self.assertFalse(owned.isClear(start.offset(3), 2))
+        self.assertEquals(list(owned), [start, start.offset(1), start.offset(2), start.offset(4)])
+
+        owned.cut(start.offset(2))
+        self.assertEquals(len(owned), 2)
+        self.assertEquals(owned.firstClear(start), start.offset(2))
+
+    def testRegionEnd(self):
+        start = address.fromConventional("0003:7FFE")
+        owned = OwnedBytes(start, address.fromConventional("0004:4000"))
+        self.assertEquals(owned.span(start, 3), 2)
+        owned.addRange(start, 2)
+        self.assertEquals(owned.firstClear(start), address.fromVirtualAndBank(0x8000, 3))
+
+    def testRuns(self):
+        start = address.fromConventional("0001:4000")
+        owned = OwnedBytes(start, address.fromConventional("0002:4000"))
+        owned.addRange(start, 3)
+        owned.addRange(start.offset(3), 4, JUMPTABLE)
+        owned.add(start.offset(8))
+        self.assertEquals(owned.runs(), [(start, 3, CODE), (start.offset(3), 4, JUMPTABLE), (start.offset(8), 1, CODE)])
+
+    def testOwnershipMap(self):
+        a = address.fromConventional("0001:4000")
+        b = address.fromConventional("0001:4010")
+        m = OwnershipMap()
+        m.setOwner(a, [(a, 0x10, CODE), (a.offset(0x20), 4, JUMPTABLE)])
+        m.setOwner(b, [(b, 0x12, CODE)])
+
+        self.assertEquals(m.ownersAt(a.offset(5)), set([a]))
+        self.assertEquals(m.ownersAt(a.offset(0x21)), set([a, b]))
+        self.assertEquals(m.kindAt(a.offset(0x23)), JUMPTABLE)
+        self.assertEquals(m.ownersAt(a.offset(0x30)), set())
+        self.assertEquals(m.nextOwnedAddress(a), b)
+        self.assertEquals(m.coverage(1), 0x24)
+        self.assertEquals(m.conflicts(1), [(a.offset(0x20), set([a, b]))])
+
+        copy = OwnershipMap()
+        copy.decodeBank(1, m.encodeBank(1))
+        self.assertEquals(copy.banks, m.banks)
+
+        m.setOwner(b, [(b, 0x10, CODE)])
+        self.assertEquals(m.conflicts(1), [])
+        self.assertEquals(m.ownedBy(b), [(b, 0x10, CODE)])
+
+
+if __name__ == "__main__":
+    unittest.main()
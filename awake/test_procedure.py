@@ -0,0 +1,60 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from .procedure import ProcedureGraph
+from . import address
+
+EXIT = ProcedureGraph.EXIT
+
+
+def makeGraph(edges):
+    g = ProcedureGraph.__new__(ProcedureGraph)
+    g.blocks = [None] * len(edges)
+    g.block_offsets = [0x14000 + 0x10 * i for i in range(len(edges))]
+    g._edges = edges
+    g._buildEdges()
+    return g
+
+
+class Test(unittest.TestCase):
+
+    def testEdges(self):
+        g = makeGraph([[1, 2], [3], [3, EXIT], [EXIT]])
+        self.assertEquals(list(g.vertices()), [0, 1, 2, 3])
+        self.assertEquals(g.childs(0), [1, 2])
+        self.assertEquals(g.childs(2), [3, None])
+        self.assertEquals(g.childs(None), [])
+        self.assertEquals(g.parents(0), [])
+        self.assertEquals(g.parents(3), [1, 2])
+        self.assertEquals(g.parents(None), [2, 3])
+
+        offsets, succ = g.successors()
+        self.assertEquals(list(offsets), [0, 2, 3, 5, 6])
+        self.assertEquals(list(succ), [1, 2, 3, 3, EXIT, EXIT])
+        offsets, pred = g.predecessors()
+        self.assertEquals(list(offsets), [0, 0, 1, 2, 4, 6])
+        self.assertEquals(list(pred), [0, 0, 1, 2, 2, 3])
+
+    def testDuplicateChilds(self):
+        # switch with two cases going to the same block
+        g = makeGraph([[1, 1, 2], [EXIT], [EXIT]])
+        self.assertEquals(g.childs(0), [1, 1, 2])
+        self.assertEquals(g.parents(1), [0, 0])
+
+    def testBlockAddress(self):
+        g = makeGraph([[1], [EXIT]])
+        self.assertEquals(g.blockAddress(1), address.fromConventional("0001:4010"))
@@ -0,0 +1,61 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from .rom import Rom
+from . import address
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        data = bytearray(0x8000)
+        data[0x0150] = 0x3E
+        data[0x0151] = 0x12
+        data[0x3FFF] = 0xAA
+        data[0x4000] = 0x34
+        data[0x4001] = 0x12
+        fd, self.filename = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self.rom = Rom(self.filename)
+
+    def tearDown(self):
+        self.rom.close()
+        os.remove(self.filename)
+
+    def testGet(self):
+        self.assertEquals(self.rom.get(address.fromVirtual(0x0150)), 0x3E)
+        self.assertEquals(self.rom.byteAt(0x3FFF), 0xAA)
+        self.assertEquals(self.rom.get(address.fromConventional("0001:4000")), 0x34)
+
+    def testWord(self):
+        self.assertEquals(self.rom.get_word(address.fromConventional("0001:4000")), 0x1234)
+        self.assertEquals(self.rom.get_word(address.fromVirtual(0x0150)), 0x123E)
+        self.assertRaises(address.BadAddressException, self.rom.get_word, address.fromVirtual(0x3FFF))
+
+    def testRead(self):
+        self.assertEquals(self.rom.read(address.fromVirtual(0x0150), 3), [0x3E, 0x12, 0x00])
+        self.assertEquals(bytearray(self.rom.read_range(address.fromConventional("0001:4000"), 2)), bytearray([0x34, 0x12]))
+
+    def testNumBanks(self):
+        self.assertEquals(self.rom.numBanks(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
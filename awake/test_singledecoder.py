@@ -65,6 +65,21 @@ class Test(unittest.TestCase):
         op = SingleOpcodeDecoder("00001000 5 LD16  [v16], SP");
         self.assertEquals(str(op.decode([0b00001000, 0xAA,0xBB], address.fromPhysical(0x100))).strip().upper(), "LD16\t[(V):BBAA], SP");
 
+    def testCompiled(self):
+        op = SingleOpcodeDecoder("11100110 2 AND   A, v8  @ read: A  write: A:(A & v8); FZ:(A == 0); FC:0; FH:1; FN:0;")
+        record = op.compiled(0b11100110)
+        self.assertEquals(record.length, 2)
+        self.assertTrue(record.operands[0].static)
+        self.assertFalse(record.operands[1].static)
+        instr, next_addr = record.decode(None, [0b11100110, 0xfa], address.fromPhysical(0x100))
+        self.assertEquals(str(instr).upper(), "AND\tA, 0XFA")
+        self.assertEquals(next_addr, address.fromPhysical(0x102))
+
+        op = SingleOpcodeDecoder("01SSSZZZ 1 LD    #S, #Z  @ read: #Z  write: #S;")
+        record = op.compiled(0b01000111)
+        self.assertTrue(record.static)
+        self.assertEquals([str(x.expr) for x in record.operands], ["B", "A"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,142 @@
+# This file is part of Awake - GB decompiler.
+# Copyright (C) 2012  Wojciech Marczenko (devdri) <wojtek.marczenko@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+from .context import Context
+from .database import Database
+from .flow import FlowAnalysis
+from .flowcontrol import Block
+from .instruction import JumpInstruction, LoadInstruction, RetInstruction
+from .operand import Condition, Constant, Dereference, ProcAddress, Register
+from .operator import Add, Equals
+from .procedure import ProcedureGraph
+from .regutil import registerMask
+from .ssa import ConstantPropagation, dominanceFrontiers, dominators, reversePostorder
+from .textrenderer import PlainTextRenderer
+from . import address
+
+EXIT = ProcedureGraph.EXIT
+
+
+def load(addr, target, source):
+    if isinstance(target, str):
+        target = Register(target)
+    return LoadInstruction('LD', target, source, address.fromVirtual(addr))
+
+
+def jump(addr, target, cond):
+    return JumpInstruction('JP', ProcAddress(address.fromVirtual(target)), Condition(cond),
+                           address.fromVirtual(addr), registerMask([cond]), 0)
+
+
+def ret(addr, cond):
+    return RetInstruction('RET', Condition(cond), address.fromVirtual(addr))
+
+
+def render(graph):
+    content = FlowAnalysis(address.fromVirtual(0x100), graph, True).analyze()
+    renderer = PlainTextRenderer(Database(':memory:'))
+    content.render(renderer)
+    return ''.join(renderer.content)
+
+
+def makeGraph(edges, blocks=None):
+    g = ProcedureGraph.__new__(ProcedureGraph)
+    if blocks is None:
+        blocks = [[] for x in edges]
+    g.blocks = [Block(x) for x in blocks]
+    g.block_offsets = [0x100 + 0x10 * i for i in range(len(edges))]
+    g._edges = edges
+    g._buildEdges()
+    return g
+
+
+class Test(unittest.TestCase):
+
+    def testDominators(self):
+        # diamond followed by a loop
+        g = makeGraph([[1, 2], [3], [3], [4], [3, EXIT]])
+        order = reversePostorder(g)
+        idom = dominators(g, order)
+        self.assertEquals(idom, {0: 0, 1: 0, 2: 0, 3: 0, 4: 3})
+        frontiers = dominanceFrontiers(g, order, idom)
+        self.assertEquals(frontiers, {0: set(), 1: set([3]), 2: set([3]), 3: set([3]), 4: set([3])})
+
+    def testLoopToStart(self):
+        g = makeGraph([[1], [0, EXIT]])
+        order = reversePostorder(g)
+        idom = dominators(g, order)
+        self.assertEquals(dominanceFrontiers(g, order, idom), {0: set([0]), 1: set([0])})
+
+    def testConstants(self):
+        # B and ROMBANK stay constant around the loop, A does not
+        blocks = [[load(0x100, 'A', Constant(1)), load(0x102, 'B', Constant(2))],
+                  [load(0x110, 'A', Add(Register('A'), Register('B')))],
+                  [load(0x120, 'C', Register('B'))]]
+        g = makeGraph([[1], [1, 2], [EXIT]], blocks)
+        ctx = Context()
+        ctx.setValue('ROMBANK', Constant(3))
+        constants = ConstantPropagation(g, ctx)
+        self.assertEquals(constants.constantsAt(1), {'B': Constant(2), 'ROMBANK': Constant(3)})
+        self.assertEquals(constants.constantsAt(2), {'B': Constant(2), 'ROMBANK': Constant(3)})
+
+    def testConstantConditions(self):
+        # the jump is always taken and the return never is, so only B = 1 reaches the store
+        blocks = [[load(0x100, 'B', Constant(1)), load(0x102, 'A', Constant(0)),
+                   load(0x103, 'FZ', Equals(Register('A'), Constant(0))), jump(0x104, 0x120, 'FZ')],
+                  [load(0x110, 'B', Constant(2))],
+                  [ret(0x120, 'FNZ')],
+                  [load(0x130, Dereference(Constant(0xC000)), Register('B'))]]
+        g = makeGraph([[1, 2], [3], [3, EXIT], [EXIT]], blocks)
+        constants = ConstantPropagation(g, Context())
+        self.assertEquals(constants.edges, set([(0, 2), (2, 3)]))
+        self.assertEquals(constants.constantsAt(1), {})
+        self.assertEquals(constants.constantsAt(3)['B'], Constant(1))
+        self.assertEquals(render(g), '\n'.join([
+            '',
+            '0000:0100 B = 1',
+            '0000:0102 A = 0',
+            '0000:0104 if (not 1) {',
+            '0000:0110   B = 2',
+            '0000:0104 } else {',
+            '0000:0120   if (not 1) {',
+            '0000:0000     return    ',
+            '0000:0120   }',
+            '0000:0104 }',
+            '0000:0130 [WORK:C000] = 1']))
+
+    def testGotoLabelConstants(self):
+        # the goto to 0x140 makes the label forget all registers, the constant B is known again after it
+        blocks = [[load(0x100, 'B', Constant(7))],
+                  [load(0x110, 'C', Register('A')), jump(0x111, 0x130, 'FZ')],
+                  [load(0x120, 'C', Register('E')), jump(0x121, 0x140, 'FC')],
+                  [load(0x130, 'D', Register('C'))],
+                  [load(0x140, Dereference(Constant(0xC000)), Register('B'))]]
+        g = makeGraph([[1], [2, 3], [3, 4], [4], [EXIT]], blocks)
+        self.assertEquals(render(g), '\n'.join([
+            '',
+            '0000:0100 B = 7',
+            '0000:0110 C = A',
+            '0000:0111 if (FNZ) {',
+            '0000:0120   C = E',
+            '0000:0121   if (FC) {',
+            '0000:0000     goto    0000:0140 @ A, BC, DE, HL, ROMBANK, SP, mem',
+            '0000:0121   }',
+            '0000:0111 }',
+            '0000:0130 D = C',
+            '0000:0140 label_0000:0140: @ A, BC, DE, HL, ROMBANK, SP, mem',
+            '0000:0140 [WORK:C000] = 7']))
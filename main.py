@@ -17,6 +17,8 @@
 from __future__ import print_function
 import argparse
 from awake.gui import MainWindow
+from awake.memory import MemoryStats
+from awake.parallel import discoverParallel
 from awake.project import Project
 from awake.server import ServerTask
 
@@ -25,11 +27,31 @@ parser.add_argument('rom_file', nargs='?')
 parser.add_argument('start_url', nargs='?')
 parser.add_argument('config_file', nargs='?')
 parser.add_argument('--server', action='store_true', default=False)
+parser.add_argument('--discover', action='store_true', default=False, help='analyse the whole rom until no dependency set changes')
+parser.add_argument('--max-steps', type=int, default=None, help='limit the number of analyses done by --discover')
+parser.add_argument('--memory', action='store_true', default=False, help='analyse every known proc and report the memory held by the caches')
+parser.add_argument('--jobs', type=int, default=None, help='number of processes used by --discover, all cores by default')
 
 if __name__ == '__main__':
     args = parser.parse_args()
 
-    if args.server:
+    if args.discover:
+        if args.rom_file:
+            proj = Project(args.rom_file, args.config_file)
+            print(str(discoverParallel(proj, max_steps=args.max_steps, jobs=args.jobs)))
+            proj.close()
+        else:
+            print("Rom file is required for discovery\n")
+    elif args.memory:
+        if args.rom_file:
+            proj = Project(args.rom_file, args.config_file)
+            for addr in proj.database.getAll():
+                proj.flow.at(addr)
+            print(str(MemoryStats(proj)))
+            proj.close()
+        else:
+            print("Rom file is required for memory report\n")
+    elif args.server:
         if args.rom_file:
             proj = Project(args.rom_file, args.config_file)
             task = ServerTask(proj)
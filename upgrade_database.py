@@ -1,4 +1,4 @@
-LATEST_VERSION=2
+LATEST_VERSION=3
 import sqlite3, argparse, os, shutil
 import upgradedb.database_versions as dbv
 import upgradedb.database_upgrades as dbu
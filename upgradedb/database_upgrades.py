@@ -1,9 +1,27 @@
 import sqlite3
 import upgradedb.database_versions as dbv
+from awake import address
 DEBUG=True
+#   Version 3 tables: [name, definition, address columns]
+V3_TABLES=[
+    ["procs","(addr address primary key, type text, depset text, has_switch integer, suspicious_switch integer, has_suspicious_instr integer, has_nop integer, has_ambig_calls integer, length integer)",["addr"]],
+    ["calls","(source address, destination address, type text, unique(source, destination, type))",["source","destination"]],
+    ["memref","(addr address, proc address, type text, unique(addr, proc, type))",["addr","proc"]],
+    ["tags","(addr address primary key, name text)",["addr"]],
+]
+V3_INDEXES=[
+    "CREATE INDEX calls_destination ON calls(destination)",
+    "CREATE INDEX memref_proc ON memref(proc)",
+]
+def addressToInteger(text):
+    if text is None:
+        return None
+    if text=="FFFF:0000":                               #Pseudo-caller of the initial entry points.
+        return address.fromVirtualAndBank(0, 0xFFFF).address
+    return address.fromConventional(text).address
 def upgrade(filename):
     ver=dbv.detectVersion(filename)
-    conn = sqlite3.connect(filename, detect_types=sqlite3.PARSE_DECLTYPES)
+    conn = sqlite3.connect(filename)                    #No converters: upgrades see the stored values as they are.
     conn.row_factory = sqlite3.Row  #Make cursors return row objects instead of tuples.
     c=conn.cursor()
     print "Upgrading database from version "+str(ver)+" to version "+str(ver+1)
@@ -20,6 +38,32 @@ def upgrade(filename):
         if (DEBUG):
             print "\tRenaming TEMP_TABLE to memref"
         c.execute("ALTER TABLE TEMP_TABLE RENAME TO memref")
+    elif ver==2:
+        for name, definition, address_columns in V3_TABLES:
+            c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (name,))
+            if c.fetchone() is None:
+                continue
+            if (DEBUG):
+                print "Storing "+name+" addresses as integers\n\tCreating TEMP_TABLE"
+            c.execute("CREATE TABLE TEMP_TABLE "+definition)
+            if (DEBUG):
+                print "\tTransferring values from "+name+" to TEMP_TABLE"
+            c.execute("SELECT * FROM "+name)
+            rows=c.fetchall()
+            if rows:
+                columns=rows[0].keys()
+                query="INSERT OR IGNORE INTO TEMP_TABLE ("+", ".join(columns)+") VALUES ("+", ".join("?" for x in columns)+")"
+                c.executemany(query, ([addressToInteger(row[col]) if col in address_columns else row[col] for col in columns] for row in rows))
+            if (DEBUG):
+                print "\tDropping "+name
+            c.execute("DROP TABLE "+name)
+            if (DEBUG):
+                print "\tRenaming TEMP_TABLE to "+name
+            c.execute("ALTER TABLE TEMP_TABLE RENAME TO "+name)
+        if (DEBUG):
+            print "Creating address indexes"
+        for index in V3_INDEXES:
+            c.execute(index)
     else:
         c.close()
         conn.close()
@@ -11,7 +11,8 @@ versions=dict()
 #   |     would reject that version.                    |
 #   |---------------------------------------------------|
 versions[1]=[["memref_proc_type","^text$"]]
-versions[2]=[["memref_proc_type","^address$"]]
+versions[2]=[["memref_proc_type","^address$"],["calls_destination_index","^!NORESULTS!$"]]
+versions[3]=[["memref_proc_type","^address$"],["calls_destination_index","^calls_destination$"]]
 tests=dict()
 #   |-----------------Test queries here-----------------|
 #   | These are the queries to run for each test,       |
@@ -25,6 +26,7 @@ tests=dict()
 #   | data_field indicates which column to return.      |
 #   |---------------------------------------------------|
 tests["memref_proc_type"]=["PRAGMA table_info(memref);","name","^proc$","type"]
+tests["calls_destination_index"]=["PRAGMA index_list(calls);","name","^calls_destination$","name"]
 def runTest(c,testname):
     test=tests[testname]
     query=test[0]